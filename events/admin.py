@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Event, EventPermission, EventVersion, EventChangeLog, EventConflict
+from .models import Event, EventOccurrence, EventPermission, EventVersion, EventChangeLog, EventConflict
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
@@ -10,6 +10,13 @@ class EventAdmin(admin.ModelAdmin):
     date_hierarchy = 'start_time'
 
 
+@admin.register(EventOccurrence)
+class EventOccurrenceAdmin(admin.ModelAdmin):
+    list_display = ('event', 'start_time', 'end_time')
+    search_fields = ('event__title',)
+    date_hierarchy = 'start_time'
+
+
 @admin.register(EventPermission)
 class EventPermissionAdmin(admin.ModelAdmin):
     list_display = ('event', 'user', 'role', 'created_at', 'updated_at')
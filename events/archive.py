@@ -0,0 +1,132 @@
+import zlib
+import msgpack
+from django.contrib.auth.models import User
+from .models import EventArchive, EventChangeLog, EventVersion
+
+# Newest first, the order reads want them in
+_ORDERING = {
+    EventArchive.Kind.CHANGELOG: lambda row: (row['changed_at'], row['id']),
+    EventArchive.Kind.VERSIONS: lambda row: row['version_number'],
+}
+
+def pack(rows):
+    return zlib.compress(msgpack.packb(rows, datetime=True))
+
+def unpack(payload):
+    return msgpack.unpackb(zlib.decompress(payload), timestamp=3)
+
+def store(event_id, kind, month, rows):
+    """
+    Add ``rows`` to an event's archive for ``month``, merging them with
+    what is already there. Run it in the transaction that deletes the
+    hot rows, so every row is in exactly one place.
+    """
+    archive = EventArchive.objects.select_for_update().filter(
+        event_id=event_id, kind=kind, month=month
+    ).first()
+    if archive is not None:
+        rows = unpack(archive.payload) + rows
+    rows.sort(key=_ORDERING[kind], reverse=True)
+    if archive is None:
+        EventArchive.objects.create(
+            event_id=event_id, kind=kind, month=month, row_count=len(rows), payload=pack(rows)
+        )
+    else:
+        archive.row_count = len(rows)
+        archive.payload = pack(rows)
+        archive.save()
+
+def archived_rows(event_id, kind):
+    """
+    An event's archived rows of one kind, newest first. Months are read
+    one at a time, so a reader that stops early skips the older ones.
+    """
+    months = list(EventArchive.objects.filter(
+        event_id=event_id, kind=kind
+    ).order_by('-month').values_list('pk', flat=True))
+    for pk in months:
+        yield from unpack(EventArchive.objects.values_list('payload', flat=True).get(pk=pk))
+
+def archived_versions(event_id):
+    """
+    Unsaved EventVersion instances for an event's archived versions,
+    newest first, each with its full ``snapshot``.
+    """
+    for row in archived_rows(event_id, EventArchive.Kind.VERSIONS):
+        version = EventVersion(
+            id=row['id'],
+            event_id=event_id,
+            version_number=row['version_number'],
+            delta=row['delta'],
+            created_by_id=row['created_by_id'],
+            created_at=row['created_at'],
+            change_reason=row['change_reason']
+        )
+        version.snapshot = row['data']
+        yield version
+
+def archived_changelog(event_id):
+    """
+    Unsaved EventChangeLog instances for an event's archived entries,
+    newest first. attach_related() fills in their users and versions.
+    """
+    for row in archived_rows(event_id, EventArchive.Kind.CHANGELOG):
+        entry = EventChangeLog(
+            id=row['id'],
+            event_id=event_id,
+            change_type=row['change_type'],
+            changed_by_id=row['changed_by_id'],
+            changed_at=row['changed_at'],
+            changes=row['changes'],
+            metadata=row['metadata']
+        )
+        entry.version_number = row['version_number']
+        yield entry
+
+def archived_changelog_values(event_id):
+    """
+    Archived changelog entries as export rows, keyed like the
+    ``.values()`` rows of the hot table.
+    """
+    for row in archived_rows(event_id, EventArchive.Kind.CHANGELOG):
+        row['version__version_number'] = row.pop('version_number')
+        yield row
+
+def attach_related(page):
+    """
+    Fill in the users, and for changelog entries the versions, that the
+    archived instances on a page of hot and archived rows refer to.
+    """
+    archived = [row for row in page if row._state.adding]
+    entries = [row for row in archived if isinstance(row, EventChangeLog)]
+    versions = [row for row in archived if isinstance(row, EventVersion)]
+    if entries:
+        event_id = entries[0].event_id
+        numbers = {entry.version_number for entry in entries}
+        by_number = {
+            version.version_number: version
+            for version in EventVersion.objects.filter(
+                event_id=event_id, version_number__in=numbers
+            ).select_related('created_by')
+        }
+        missing = numbers - set(by_number)
+        if missing:
+            for version in archived_versions(event_id):
+                if version.version_number in missing:
+                    by_number[version.version_number] = version
+                    versions.append(version)
+                if version.version_number <= min(missing):
+                    break
+        for entry in entries:
+            entry.version = by_number[entry.version_number]
+
+    users = User.objects.in_bulk(
+        {entry.changed_by_id for entry in entries} | {version.created_by_id for version in versions}
+    )
+    for entry in entries:
+        if entry.changed_by_id in users:
+            entry.changed_by = users[entry.changed_by_id]
+    for version in versions:
+        if version.created_by_id in users:
+            version.created_by = users[version.created_by_id]
+    return page
@@ -0,0 +1,122 @@
+import threading
+import time
+from functools import partial
+from django.db import connection, transaction
+from .conf import events_setting
+from .feed import publish_changes
+from .models import ChangeLogOutbox, EventChangeLog
+from .tasks import enqueue, run_with_retry
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_scheduled = False
+_pending = 0
+_last_drain = time.monotonic()
+
+def record_change(event, version, change_type, changed_by, changes, metadata=None):
+    """
+    Log a change to ``event``. The entry is written to the outbox in the
+    current transaction, so it commits or rolls back with the change
+    itself, and reaches EventChangeLog with the next drain.
+    """
+    ChangeLogOutbox.objects.create(
+        event_id=event.pk,
+        version_id=version.pk,
+        change_type=change_type,
+        changed_by_id=changed_by.pk,
+        changes=changes,
+        metadata=metadata or {}
+    )
+    transaction.on_commit(schedule_drain)
+
+def schedule_drain():
+    """
+    Drain the outbox once AUDIT_FLUSH_INTERVAL has passed or
+    AUDIT_BATCH_SIZE entries have committed, whichever comes first.
+    """
+    global _scheduled, _pending, _last_drain
+    if events_setting('TASKS_EAGER'):
+        drain()
+        return
+    if connection.vendor == 'sqlite':
+        # SQLite takes one writer at a time, and pool threads draining next
+        # to requests fail them with "database is locked"; drain here when
+        # due, and otherwise leave one timer to drain when the interval is up
+        with _lock:
+            _pending += 1
+            wait = events_setting('AUDIT_FLUSH_INTERVAL') - (time.monotonic() - _last_drain)
+            if _pending < events_setting('AUDIT_BATCH_SIZE') and wait > 0:
+                if not _scheduled:
+                    _scheduled = True
+                    timer = threading.Timer(wait, _drain_on_timer)
+                    timer.daemon = True
+                    timer.start()
+                return
+            _pending = 0
+            _last_drain = time.monotonic()
+        drain()
+        return
+    with _lock:
+        _pending += 1
+        if _pending >= events_setting('AUDIT_BATCH_SIZE'):
+            _wakeup.set()
+        if _scheduled:
+            return
+        _scheduled = True
+    enqueue(_drain_when_due)
+
+def _drain_when_due():
+    global _scheduled, _pending
+    _wakeup.wait(events_setting('AUDIT_FLUSH_INTERVAL'))
+    with _lock:
+        _scheduled = False
+        _pending = 0
+        _wakeup.clear()
+    drain()
+
+def _drain_on_timer():
+    global _scheduled, _pending, _last_drain
+    with _lock:
+        _scheduled = False
+        _pending = 0
+        _last_drain = time.monotonic()
+    run_with_retry(drain, worker=True)
+
+def drain(event_id=None):
+    """
+    Move outbox entries into EventChangeLog, oldest first, with one
+    bulk INSERT per AUDIT_BATCH_SIZE entries. Each batch leaves the
+    outbox in the same transaction, so entries are never lost or copied
+    twice. Returns the number of entries moved.
+    """
+    batch_size = events_setting('AUDIT_BATCH_SIZE')
+    pending = ChangeLogOutbox.objects.order_by('id')
+    if event_id is not None:
+        pending = pending.filter(event_id=event_id)
+    moved = 0
+    while True:
+        entries = list(pending[:batch_size])
+        if not entries:
+            return moved
+        with transaction.atomic():
+            # Claim the batch by deleting it first; a write as the opening
+            # statement also keeps SQLite from failing on a lock upgrade
+            deleted, _ = ChangeLogOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+            if deleted != len(entries):
+                # Another drain claimed some of these; start over from what is left
+                transaction.set_rollback(True)
+                continue
+            created = EventChangeLog.objects.bulk_create([
+                EventChangeLog(
+                    event_id=entry.event_id,
+                    version_id=entry.version_id,
+                    change_type=entry.change_type,
+                    changed_by_id=entry.changed_by_id,
+                    changed_at=entry.changed_at,
+                    changes=entry.changes,
+                    metadata=entry.metadata
+                )
+                for entry in entries
+            ])
+            transaction.on_commit(partial(publish_changes, [entry.pk for entry in created]))
+        moved += len(entries)
@@ -0,0 +1,210 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import F, Max, Q, Window
+from django.db.models.expressions import RowRange
+from .conf import events_setting
+from .models import Event, EventOccurrence, EventPermission
+from .recurrence import expand_occurrences
+
+class EarlierRows(RowRange):
+    """
+    ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING, a frame RowRange
+    cannot spell on Django 5.0.
+    """
+
+    def window_frame_start_end(self, connection, start, end):
+        return connection.ops.UNBOUNDED_PRECEDING, f'1 {connection.ops.PRECEDING}'
+
+def merge_intervals(intervals):
+    """
+    Sweep sorted [start, end) intervals into the disjoint, sorted list
+    covering the same time. Touching intervals are joined.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+def free_intervals(busy, start, end):
+    """
+    Gaps in the merged ``busy`` intervals within [start, end).
+    """
+    free = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_start > cursor:
+            free.append([cursor, min(busy_start, end)])
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            return free
+    if cursor < end:
+        free.append([cursor, end])
+    return free
+
+def subtract_intervals(intervals, busy):
+    """
+    Parts of the sorted, disjoint ``intervals`` not covered by the merged
+    ``busy`` intervals, in one pass over both lists.
+    """
+    remaining = []
+    index = 0
+    for start, end in intervals:
+        while index < len(busy) and busy[index][1] <= start:
+            index += 1
+        cursor = start
+        position = index
+        while position < len(busy) and busy[position][0] < end:
+            if busy[position][0] > cursor:
+                remaining.append([cursor, busy[position][0]])
+            cursor = max(cursor, busy[position][1])
+            position += 1
+        if cursor < end:
+            remaining.append([cursor, end])
+    return remaining
+
+def clip(merged, start, end):
+    # Only the ends of a merged list can reach outside the window
+    if merged:
+        merged[0][0] = max(merged[0][0], start)
+        merged[-1][1] = min(merged[-1][1], end)
+    return merged
+
+def unmaterialized_occurrences(shared, start, end):
+    """
+    ``(event_id, start, end)`` for occurrences in [start, end) of the live
+    events in ``shared`` (a queryset of their ids) that EventOccurrence
+    does not hold yet, expanded from their recurrence rules.
+    """
+    occurrences = []
+    for event_id, *schedule, occurrences_until in Event.objects.filter(
+        Q(occurrences_until__isnull=True) | Q(is_recurring=True, occurrences_until__lt=end),
+        start_time__lt=end,
+        is_deleted=False,
+        pk__in=shared
+    ).order_by().values_list(
+        'id', 'start_time', 'end_time', 'is_recurring', 'recurrence_pattern', 'occurrences_until'
+    ):
+        for occurrence in expand_occurrences([(event_id, *schedule)], start, end):
+            if occurrences_until is None or occurrence.start >= occurrences_until:
+                occurrences.append((event_id, occurrence.start, occurrence.end))
+    return occurrences
+
+def busy_intervals(user_ids, start, end):
+    """
+    Merged busy time of each user in [start, end), from the live events
+    they hold a permission on: one range read over the materialized
+    occurrences, plus series not materialized that far, expanded on the fly.
+    """
+    shared = EventPermission.objects.filter(user_id__in=user_ids)
+    intervals = defaultdict(list)
+    # Deleting an event clears its occurrences, so every row here is live
+    for user_id, busy_start, busy_end in EventOccurrence.objects.filter(
+        start_time__lt=end,
+        end_time__gt=start,
+        event__permissions__user_id__in=user_ids
+    ).order_by().values_list('event__permissions__user_id', 'start_time', 'end_time'):
+        intervals[user_id].append((busy_start, busy_end))
+
+    pending = unmaterialized_occurrences(shared.values('event_id'), start, end)
+    if pending:
+        holders = defaultdict(list)
+        for event_id, user_id in shared.filter(
+            event_id__in={event_id for event_id, _, _ in pending}
+        ).values_list('event_id', 'user_id'):
+            holders[event_id].append(user_id)
+        for event_id, busy_start, busy_end in pending:
+            for user_id in holders[event_id]:
+                intervals[user_id].append((busy_start, busy_end))
+
+    return {user_id: clip(merge_intervals(intervals[user_id]), start, end) for user_id in user_ids}
+
+def merged_occurrences(shared, start, end):
+    """
+    Merged busy time from the materialized occurrences, overlapping
+    [start, end), of the events in ``shared`` (a queryset of their ids).
+    The database does the merge: an occurrence starting after every
+    earlier one has ended opens a new interval, and only those rows are
+    read back, with the furthest end reached before them, which closes
+    the previous interval.
+    """
+    order = [F('start_time').asc(), F('end_time').asc()]
+    rows = EventOccurrence.objects.filter(
+        start_time__lt=end, end_time__gt=start, event_id__in=shared
+    ).annotate(
+        reached=Window(Max('end_time'), order_by=order, frame=EarlierRows()),
+        last_end=Window(Max('end_time')),
+    ).filter(
+        Q(reached__isnull=True) | Q(start_time__gt=F('reached'))
+    ).order_by('start_time').values_list('start_time', 'reached', 'last_end')
+
+    merged = []
+    for busy_start, reached, last_end in rows:
+        if merged:
+            merged[-1][1] = reached
+        merged.append([busy_start, last_end])
+    return merged
+
+def working_intervals(start, end, work_start, work_end, weekdays, zone):
+    """
+    The working hours ``work_start``-``work_end`` in ``zone`` of each of
+    ``weekdays`` (Monday is 0), as [start, end) intervals within the window.
+    They are returned in UTC, where adding a duration cannot cross a DST
+    change unnoticed.
+    """
+    intervals = []
+    day = start.astimezone(zone).date()
+    while True:
+        day_start = datetime.combine(day, work_start, tzinfo=zone).astimezone(dt_timezone.utc)
+        if day_start >= end:
+            return intervals
+        day_end = datetime.combine(day, work_end, tzinfo=zone).astimezone(dt_timezone.utc)
+        if day.weekday() in weekdays and day_end > start:
+            intervals.append([max(day_start, start), min(day_end, end)])
+        day += timedelta(days=1)
+
+def find_slots(user_ids, working, duration, step, count):
+    """
+    The first ``count`` start times, ``step`` apart from the start of each
+    working interval, at which none of ``user_ids`` is busy for
+    ``duration``. Busy time is read over SLOT_SEARCH_DAYS of working
+    intervals first, then twice as many each round, so an early answer
+    never reads the whole window and a late one reads it about twice.
+    """
+    slots = []
+    if not working:
+        return slots
+    shared = EventPermission.objects.filter(user_id__in=user_ids).values('event_id')
+    pending = [
+        [busy_start, busy_end]
+        for _, busy_start, busy_end in unmaterialized_occurrences(shared, working[0][0], working[-1][1])
+    ]
+    span = timedelta(days=events_setting('SLOT_SEARCH_DAYS'))
+    first = 0
+    while first < len(working) and len(slots) < count:
+        last = first
+        while last + 1 < len(working) and working[last + 1][1] - working[first][0] <= span:
+            last += 1
+        chunk = working[first:last + 1]
+        chunk_start, chunk_end = chunk[0][0], chunk[-1][1]
+        busy = merge_intervals(merged_occurrences(shared, chunk_start, chunk_end) + [
+            interval for interval in pending if interval[0] < chunk_end and interval[1] > chunk_start
+        ])
+        day = 0
+        for free_start, free_end in subtract_intervals(chunk, busy):
+            while chunk[day][1] <= free_start:
+                day += 1
+            # Round up to the next step from the start of the working interval
+            anchor = chunk[day][0]
+            candidate = anchor + -(-(free_start - anchor) // step) * step
+            while candidate + duration <= free_end:
+                slots.append(candidate)
+                if len(slots) == count:
+                    return slots
+                candidate += step
+        first = last + 1
+        span *= 2
+    return slots
@@ -0,0 +1,137 @@
+from functools import partial
+from itertools import islice
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from .cache import invalidate_roles, touch_collections
+from .conflicts import schedule_conflict_detection
+from .feed import publish_changes
+from .models import Event, EventChangeLog, EventPermission, EventVersion
+from .occurrences import sync_occurrences
+from .serializers import EventCreateSerializer
+from .versions import build_version, snapshot
+
+def build_events(items, user):
+    """
+    Turn validated EventCreateSerializer items into unsaved events and
+    permissions. Raises ValidationError, with one entry per item like a
+    ``many=True`` serializer, when a grant names an unknown user.
+    """
+    requested = {grant['user_id'] for data in items for grant in data.get('permissions', [])}
+    users = User.objects.in_bulk(requested | {user.pk})
+    errors = [
+        {'permissions': [f"Unknown user_id {grant['user_id']}"
+                         for grant in data.get('permissions', []) if grant['user_id'] not in users]}
+        for data in items
+    ]
+    if any(error['permissions'] for error in errors):
+        raise serializers.ValidationError([error if error['permissions'] else {} for error in errors])
+
+    events, permissions = [], []
+    for data in items:
+        data = dict(data)
+        grants = data.pop('permissions', [])
+        event = Event(created_by=user, **data)
+        event_permissions = {user.pk: EventPermission(event=event, user=user, role=EventPermission.Role.OWNER)}
+        for grant in grants:
+            # The first grant wins; the creator always stays owner
+            event_permissions.setdefault(
+                grant['user_id'],
+                EventPermission(event=event, user=users[grant['user_id']], role=grant['role'])
+            )
+        # Prime the caches EventSerializer reads so the response needs no queries
+        event._prefetched_objects_cache = {'permissions': list(event_permissions.values())}
+        event.latest_versions = []
+        events.append(event)
+        permissions.extend(event_permissions.values())
+    return events, permissions
+
+def bulk_create_events(items, user):
+    """
+    Create events from validated EventCreateSerializer items with one
+    bulk INSERT each for events, permissions, versions and changelog
+    entries, then queue a single conflict pass over the whole batch.
+    """
+    events, permissions = build_events(items, user)
+    with transaction.atomic():
+        Event.objects.bulk_create(events)
+        EventPermission.objects.bulk_create(permissions)
+        invalidate_roles((permission.user_id, permission.event_id) for permission in permissions)
+        touch_collections(permission.user_id for permission in permissions)
+
+        versions = EventVersion.objects.bulk_create([
+            build_version(event, None, snapshot(event), user, 'Initial version')
+            for event in events
+        ])
+        entries = EventChangeLog.objects.bulk_create([
+            EventChangeLog(
+                event=event,
+                version=version,
+                change_type=EventChangeLog.ChangeType.CREATE,
+                changed_by=user,
+                changes={'action': 'created'},
+                metadata={'initial_version': True, 'batch': True}
+            )
+            for event, version in zip(events, versions)
+        ])
+        # Written past the outbox, so no drain will push them to the feed
+        transaction.on_commit(partial(publish_changes, [entry.pk for entry in entries]))
+
+        sync_occurrences(events)
+        schedule_conflict_detection(events)
+
+    for event, version in zip(events, versions):
+        event.latest_versions = [version]
+    return events
+
+def _create_chunk(chunk, user):
+    """
+    Create the validated ``(row, data)`` pairs of one import chunk.
+    Returns (created, error_reports).
+    """
+    try:
+        bulk_create_events([data for _, data in chunk], user)
+        return len(chunk), []
+    except serializers.ValidationError as exc:
+        # Report the items that name unknown users and import the rest
+        reports = [
+            {'row': row, 'errors': error}
+            for (row, _), error in zip(chunk, exc.detail) if error
+        ]
+        valid = [item for item, error in zip(chunk, exc.detail) if not error]
+        if valid:
+            bulk_create_events([data for _, data in valid], user)
+        return len(valid), reports
+
+def stream_import(rows, user, chunk_size):
+    """
+    Validate and create events from an iterable of raw rows, ``chunk_size``
+    rows at a time, so memory stays bounded however long the input is.
+    Each chunk commits on its own. Yields a report for every rejected row
+    and finally a summary of the whole import.
+    """
+    child = EventCreateSerializer(many=True).child
+    rows = enumerate(rows, 1)
+    created = failed = 0
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+        chunk = []
+        for row, data in batch:
+            if isinstance(data, ParseError):
+                failed += 1
+                yield {'row': row, 'errors': {'non_field_errors': [data.detail]}}
+                continue
+            try:
+                chunk.append((row, child.run_validation(data)))
+            except serializers.ValidationError as exc:
+                failed += 1
+                yield {'row': row, 'errors': exc.detail}
+        if chunk:
+            count, reports = _create_chunk(chunk, user)
+            created += count
+            failed += len(reports)
+            yield from reports
+    yield {'created': created, 'failed': failed}
@@ -0,0 +1,229 @@
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils.http import parse_etags
+from django.utils.module_loading import import_string
+from .conf import events_setting
+from .models import EventCollection, EventPermission
+
+# Cached in place of a role when the user has no permission on the event
+NO_ROLE = ''
+
+class MemoryBackend:
+    """
+    Process-local store with per-entry expiry and least-recently-used
+    eviction. Invalidation only reaches the current process, so run with
+    a shared backend when there is more than one.
+    """
+    # A cached "no role" would hide grants made through other processes
+    shared = False
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+class DjangoCacheBackend:
+    """
+    Stores entries in a Django cache, e.g. Redis through django-redis, so
+    every process shares them and sees invalidations.
+    """
+    shared = True
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.cache = caches[events_setting('PERMISSION_CACHE_ALIAS')]
+
+    @staticmethod
+    def make_key(key):
+        return 'events:role:%s:%s' % key
+
+    def get(self, key):
+        return self.cache.get(self.make_key(key))
+
+    def set(self, key, value):
+        self.cache.set(self.make_key(key), value, self.ttl)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.make_key(key) for key in keys])
+
+    def clear(self):
+        # Entries expire on their own; the cache may be shared with other data
+        pass
+
+    def __len__(self):
+        return 0
+
+class RoleCache:
+    """
+    Maps (user_id, event_id) to the user's role on the event, counting
+    hits and misses. Users without a role are only remembered by shared
+    backends, which every grant invalidates.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id, event_id):
+        key = (user_id, str(event_id))
+        role = self.backend.get(key)
+        with self.lock:
+            if role is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if role is None:
+            role = EventPermission.objects.filter(
+                user_id=user_id, event_id=event_id
+            ).values_list('role', flat=True).first() or NO_ROLE
+            if role or self.backend.shared:
+                self.backend.set(key, role)
+        return role or None
+
+    def invalidate(self, pairs):
+        self.backend.delete_many([(user_id, str(event_id)) for user_id, event_id in pairs])
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.backend),
+        }
+
+_role_cache = None
+_role_cache_lock = threading.Lock()
+
+def get_role_cache():
+    global _role_cache
+    with _role_cache_lock:
+        if _role_cache is None:
+            backend = import_string(events_setting('PERMISSION_CACHE_BACKEND'))
+            _role_cache = RoleCache(backend(
+                events_setting('PERMISSION_CACHE_TTL'),
+                events_setting('PERMISSION_CACHE_SIZE'),
+            ))
+        return _role_cache
+
+def get_role(request, event):
+    """
+    The role of ``request.user`` on ``event``, or None. Answers are kept
+    on the request too, so repeated checks within it cost nothing.
+    """
+    roles = getattr(request, '_event_roles', None)
+    if roles is None:
+        roles = request._event_roles = {}
+    if event.pk not in roles:
+        roles[event.pk] = get_role_cache().get(request.user.pk, event.pk)
+    return roles[event.pk]
+
+def invalidate_roles(pairs):
+    """
+    Drop cached roles for (user_id, event_id) pairs once the current
+    transaction commits, so no reader can cache the old role again.
+    """
+    pairs = list(pairs)
+    if pairs:
+        transaction.on_commit(lambda: get_role_cache().invalidate(pairs))
+
+def response_cache():
+    return caches[events_setting('RESPONSE_CACHE_ALIAS')]
+
+def etag_matches(request, etag):
+    """
+    Whether ``etag`` satisfies the request's If-None-Match header.
+    """
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or etag in etags
+
+def if_match_version(request, event):
+    """
+    The version an edit must apply to: ``event.version`` when the
+    request's If-Match header names it, as a version number or an
+    event_etag(), or when there is no header; None otherwise.
+    """
+    header = request.headers.get('If-Match')
+    if header is None:
+        return event.version
+    for tag in header.split(','):
+        tag = tag.strip().strip('"')
+        prefix, _, rest = tag.partition(f'{event.pk}-')
+        version = rest.split('-')[0] if rest and not prefix else tag
+        if tag == '*' or version == str(event.version):
+            return event.version
+    return None
+
+def event_etag(event):
+    """
+    Strong ETag for an event's representation. ``version`` moves on every
+    edit and ``updated_at`` on changes that keep the version, like sharing.
+    """
+    return f'"{event.pk}-{event.version}-{event.updated_at.timestamp():.6f}"'
+
+def touch_collections(user_ids):
+    """
+    Move the collection token of each of ``user_ids``, expiring every list
+    ETag and cached list page they hold. The token is a database row, so
+    the write is seen by every process once the transaction commits.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    EventCollection.objects.bulk_create(
+        [EventCollection(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+    EventCollection.objects.filter(user_id__in=user_ids).update(version=F('version') + 1)
+
+def touch_event_collections(event):
+    touch_collections(EventPermission.objects.filter(event=event).values_list('user_id', flat=True))
+
+def collection_etag(request):
+    """
+    Strong ETag for one page of ``request.user``'s event list: their
+    collection token, everything in the URL that shapes the page, and the
+    negotiated media type, since each renderer makes a different body.
+    """
+    version = EventCollection.objects.filter(user=request.user).values_list('version', flat=True).first()
+    digest = sha1(
+        f'{version or 0}:{request.build_absolute_uri()}:{request.accepted_renderer.media_type}'.encode()
+    ).hexdigest()
+    return f'"{request.user.pk}-{digest}"'
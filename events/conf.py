@@ -0,0 +1,60 @@
+from django.conf import settings
+
+DEFAULTS = {
+    # Background work queue. TASKS_EAGER runs jobs inline in the request;
+    # None runs them inline on SQLite only, which takes one writer at a time,
+    # so pool threads would fail with "database is locked" next to requests
+    'TASKS_EAGER': None,
+    'TASK_WORKERS': 4,
+    'TASK_MAX_RETRIES': 3,
+    'TASK_RETRY_DELAY': 0.5,
+    # Longest window GET /api/events/range/ will expand
+    'RANGE_MAX_DAYS': 366,
+    # How far ahead recurring events are materialized in EventOccurrence
+    'OCCURRENCE_HORIZON_DAYS': 365,
+    # Rows validated and inserted per transaction by POST /api/events/import/
+    'IMPORT_CHUNK_SIZE': 1000,
+    # Rows fetched per database round trip by the streaming exports
+    'EXPORT_CHUNK_SIZE': 2000,
+    # (user, event) -> role cache behind the object permission checks;
+    # use events.cache.DjangoCacheBackend to share it through a cache alias
+    'PERMISSION_CACHE_BACKEND': 'events.cache.MemoryBackend',
+    'PERMISSION_CACHE_ALIAS': 'default',
+    'PERMISSION_CACHE_TTL': 300,
+    'PERMISSION_CACHE_SIZE': 100000,
+    # Serialized event and list payloads, keyed by their ETags
+    'RESPONSE_CACHE_ALIAS': 'default',
+    'RESPONSE_CACHE_TTL': 300,
+    # Every Nth EventVersion stores a full snapshot; the rest store deltas
+    'VERSION_KEYFRAME_INTERVAL': 20,
+    # Most versions GET /api/events/{id}/diff/range/ returns in one call
+    'DIFF_RANGE_MAX_VERSIONS': 1000,
+    # Changelog entries are moved out of the outbox in batches of this size,
+    # at most this many seconds after they commit
+    'AUDIT_BATCH_SIZE': 500,
+    'AUDIT_FLUSH_INTERVAL': 1.0,
+    # Changelog entries and versions older than this many days are moved to
+    # EventArchive by manage.py archive_history
+    'ARCHIVE_AFTER_DAYS': 90,
+    # GET /api/events/feed/ change stream; use events.feed.RedisBroker to
+    # reach subscribers on every process
+    'FEED_BROKER': 'events.feed.MemoryBroker',
+    'FEED_REDIS_URL': 'redis://localhost:6379/0',
+    'FEED_HEARTBEAT': 15,
+    'FEED_QUEUE_SIZE': 1000,
+    # GET /api/events/sync/ holds back changes younger than this many seconds,
+    # so a slow transaction that commits late cannot land behind a cursor
+    'SYNC_SETTLE_SECONDS': 2,
+    # Most users POST /api/events/freebusy/ answers for in one call
+    'FREEBUSY_MAX_USERS': 200,
+    # POST /api/events/slots/ returns at most this many slots, and reads busy
+    # time this many days at a time until it has found enough
+    'SLOT_MAX_RESULTS': 50,
+    'SLOT_SEARCH_DAYS': 7,
+}
+
+def events_setting(name):
+    """
+    Read an ``EVENTS`` setting, falling back to the app default.
+    """
+    return getattr(settings, 'EVENTS', {}).get(name, DEFAULTS[name])
@@ -0,0 +1,324 @@
+from collections import defaultdict
+from operator import itemgetter
+from django.db import transaction
+from django.db.models import Q
+from .availability import unmaterialized_occurrences
+from .conf import events_setting
+from .models import Event, EventConflict, EventOccurrence, EventPermission
+from .tasks import enqueue_on_commit
+
+class IntervalIndex:
+    """
+    Static augmented interval tree over half-open [start, end) intervals.
+
+    Intervals are stored sorted by start time in flat lists. The tree is
+    implicit (the midpoint of every slice is the root of that slice) and each
+    node keeps the largest end time found in its subtree, so an overlap query
+    touches O(log n + k) nodes for k matches.
+    """
+    __slots__ = ('_starts', '_ends', '_keys', '_max_ends')
+
+    def __init__(self, intervals):
+        items = sorted(intervals, key=itemgetter(0))
+        self._starts = [item[0] for item in items]
+        self._ends = [item[1] for item in items]
+        self._keys = [item[2] for item in items]
+        self._max_ends = list(self._ends)
+        self._build(0, len(items))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._ends[mid]
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > max_end:
+                max_end = child
+        self._max_ends[mid] = max_end
+        return max_end
+
+    def overlapping(self, start, end):
+        """
+        Yield the keys of all intervals overlapping [start, end).
+        """
+        stack = [(0, len(self._starts))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            # Nothing in this subtree ends after the query starts
+            if self._max_ends[mid] <= start:
+                continue
+            stack.append((lo, mid))
+            # Everything right of mid starts at or after starts[mid]
+            if self._starts[mid] < end:
+                if self._ends[mid] > start:
+                    yield self._keys[mid]
+                stack.append((mid + 1, hi))
+
+def conflict_pair(event_id, other_id):
+    """
+    Return the canonical (event_id, conflicting_event_id) ordering for a pair,
+    so each overlapping pair is stored exactly once.
+    """
+    return (event_id, other_id) if event_id < other_id else (other_id, event_id)
+
+def build_user_indexes(user_ids, start, end):
+    """
+    Build one IntervalIndex per user over the occurrences of the live events
+    that user holds a permission on and that overlap [start, end), so only
+    the participants' own calendars are ever compared. Events not
+    materialized that far are expanded from their rules.
+    """
+    rows = EventOccurrence.objects.filter(
+        start_time__lt=end,
+        end_time__gt=start,
+        event__is_deleted=False,
+        event__permissions__user_id__in=user_ids
+    ).order_by().values_list('event__permissions__user_id', 'start_time', 'end_time', 'event_id')
+
+    intervals = defaultdict(list)
+    for user_id, event_start, event_end, event_id in rows:
+        intervals[user_id].append((event_start, event_end, event_id))
+
+    shared = EventPermission.objects.filter(user_id__in=user_ids)
+    pending = unmaterialized_occurrences(shared.values('event_id'), start, end)
+    if pending:
+        holders = defaultdict(list)
+        for event_id, user_id in shared.filter(
+            event_id__in={event_id for event_id, _, _ in pending}
+        ).values_list('event_id', 'user_id'):
+            holders[event_id].append(user_id)
+        for event_id, event_start, event_end in pending:
+            for user_id in holders[event_id]:
+                intervals[user_id].append((event_start, event_end, event_id))
+    return {user_id: IntervalIndex(items) for user_id, items in intervals.items()}
+
+def find_conflicts(events):
+    """
+    The conflicting (event_id, conflicting_event_id) pairs of a batch of
+    events. Two events conflict when any of their occurrences overlap and
+    they share at least one participant. The query count does not grow
+    with the batch: participants, the batch's own occurrences, one scoped
+    range read feeding the per-user interval indexes, and one read of the
+    events not materialized that far (plus their holders, if any).
+    """
+    events = [event for event in events if not event.is_deleted]
+    if not events:
+        return set()
+    event_ids = [event.id for event in events]
+
+    participants = defaultdict(set)
+    for event_id, user_id in EventPermission.objects.filter(
+        event_id__in=event_ids
+    ).order_by().values_list('event_id', 'user_id'):
+        participants[event_id].add(user_id)
+
+    intervals = defaultdict(list)
+    for event_id, start, end in EventOccurrence.objects.filter(
+        event_id__in=event_ids
+    ).order_by().values_list('event_id', 'start_time', 'end_time'):
+        intervals[event_id].append((start, end))
+    for event in events:
+        # Not materialized yet: fall back to the first occurrence
+        if not intervals[event.id]:
+            intervals[event.id].append((event.start_time, event.end_time))
+
+    indexes = build_user_indexes(
+        set().union(*participants.values()),
+        min(start for spans in intervals.values() for start, end in spans),
+        max(end for spans in intervals.values() for start, end in spans)
+    )
+
+    pairs = set()
+    for event in events:
+        for user_id in participants[event.id]:
+            index = indexes.get(user_id)
+            if index is None:
+                continue
+            for start, end in intervals[event.id]:
+                for other_id in index.overlapping(start, end):
+                    if other_id != event.id:
+                        pairs.add(conflict_pair(event.id, other_id))
+    return pairs
+
+def insert_conflicts(pairs):
+    EventConflict.objects.bulk_create(
+        [
+            EventConflict(
+                event_id=event_id,
+                conflicting_event_id=other_id,
+                resolution_status=EventConflict.ResolutionStatus.PENDING
+            )
+            for event_id, other_id in pairs
+        ],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+def detect_conflicts(events):
+    """
+    Detect and record conflicts for a batch of events, with one bulk insert
+    on top of find_conflicts(). Returns the set of conflicting pairs.
+    """
+    pairs = find_conflicts(events)
+    insert_conflicts(pairs)
+    return pairs
+
+def involving(event_ids):
+    return EventConflict.objects.filter(
+        Q(event_id__in=event_ids) | Q(conflicting_event_id__in=event_ids)
+    )
+
+def refresh_conflicts(events):
+    """
+    Bring the recorded conflicts of ``events`` in line with their current
+    schedules and participants, in the caller's transaction: pairs that
+    no longer overlap are deleted and new ones inserted, leaving the rest,
+    and their resolution status, alone. Returns (added, removed) counts.
+    """
+    events = list(events)
+    recorded = {}
+    for pk, event_id, other_id in involving([event.id for event in events]).values_list(
+        'pk', 'event_id', 'conflicting_event_id'
+    ):
+        recorded[conflict_pair(event_id, other_id)] = pk
+    current = find_conflicts(events)
+
+    added = current - recorded.keys()
+    stale = [pk for pair, pk in recorded.items() if pair not in current]
+    EventConflict.objects.filter(pk__in=stale).delete()
+    insert_conflicts(added)
+    return len(added), len(stale)
+
+def clear_conflicts(event):
+    involving([event.id]).delete()
+
+def existing_pairs(pairs):
+    """
+    The canonical pairs among ``pairs`` that already have an EventConflict
+    row, whichever way round it was stored.
+    """
+    existing = set()
+    pairs = sorted(pairs)
+    for offset in range(0, len(pairs), 500):
+        batch = pairs[offset:offset + 500]
+        event_ids = {event_id for pair in batch for event_id in pair}
+        existing.update(
+            conflict_pair(event_id, other_id)
+            for event_id, other_id in EventConflict.objects.filter(
+                event_id__in=event_ids, conflicting_event_id__in=event_ids
+            ).values_list('event_id', 'conflicting_event_id')
+        )
+    return existing
+
+def sweep_conflicts(start, end, longest):
+    """
+    Record every conflict whose overlap begins in [start, end), in one pass
+    over the live occurrences ordered by start time. Each participant's
+    occurrences still running are kept aside, and a new one is only
+    compared with those. ``longest`` is the longest occurrence, so those
+    still running at ``start`` are read without scanning everything before.
+    Returns the number of pairs inserted.
+    """
+    rows = EventOccurrence.objects.filter(
+        start_time__gte=start - longest,
+        start_time__lt=end,
+        end_time__gt=start,
+        event__is_deleted=False,
+        event__permissions__isnull=False
+    ).order_by('start_time').values_list(
+        'start_time', 'end_time', 'event_id', 'event__permissions__user_id'
+    )
+    running = defaultdict(list)
+    pairs = set()
+    for occurrence_start, occurrence_end, event_id, user_id in rows.iterator(
+        chunk_size=events_setting('EXPORT_CHUNK_SIZE')
+    ):
+        active = [item for item in running[user_id] if item[0] > occurrence_start]
+        # Overlaps beginning before the range belong to the previous one
+        if occurrence_start >= start:
+            for _, other_id in active:
+                if other_id != event_id:
+                    pairs.add(conflict_pair(event_id, other_id))
+        active.append((occurrence_end, event_id))
+        running[user_id] = active
+
+    missing = pairs - existing_pairs(pairs)
+    insert_conflicts(missing)
+    return len(missing)
+
+def overlaps(spans, other_spans):
+    """
+    Whether any of two sorted lists of [start, end) intervals overlap.
+    """
+    index = other_index = 0
+    while index < len(spans) and other_index < len(other_spans):
+        if spans[index][1] <= other_spans[other_index][0]:
+            index += 1
+        elif other_spans[other_index][1] <= spans[index][0]:
+            other_index += 1
+        else:
+            return True
+    return False
+
+def prune_conflicts(first_pk, last_pk):
+    """
+    Delete the EventConflict rows with pks in [first_pk, last_pk) that no
+    longer hold: one of the events was deleted, they stopped sharing a
+    participant, or they were moved apart. Returns the number deleted.
+    """
+    rows = list(EventConflict.objects.filter(
+        pk__gte=first_pk, pk__lt=last_pk
+    ).values_list('pk', 'event_id', 'conflicting_event_id'))
+    event_ids = {event_id for row in rows for event_id in row[1:]}
+    live = set(Event.objects.filter(
+        pk__in=event_ids, is_deleted=False
+    ).values_list('pk', flat=True))
+
+    participants = defaultdict(set)
+    for event_id, user_id in EventPermission.objects.filter(
+        event_id__in=live
+    ).order_by().values_list('event_id', 'user_id'):
+        participants[event_id].add(user_id)
+    spans = defaultdict(list)
+    for event_id, start, end in EventOccurrence.objects.filter(
+        event_id__in=live
+    ).order_by('start_time').values_list('event_id', 'start_time', 'end_time'):
+        spans[event_id].append((start, end))
+
+    stale = [
+        pk for pk, event_id, other_id in rows
+        if not (
+            event_id in live and other_id in live
+            and participants[event_id] & participants[other_id]
+            and overlaps(spans[event_id], spans[other_id])
+        )
+    ]
+    EventConflict.objects.filter(pk__in=stale).delete()
+    return len(stale)
+
+def detect_event_conflicts(event):
+    """
+    Detect conflicts between the given event and other events.
+    A conflict occurs when two events sharing a participant overlap in time.
+    """
+    return detect_conflicts([event])
+
+def detect_conflicts_for_ids(event_ids):
+    """
+    Background job entry point: reload the events and record their conflicts.
+    """
+    with transaction.atomic():
+        return detect_conflicts(Event.objects.filter(id__in=event_ids))
+
+def schedule_conflict_detection(events):
+    """
+    Queue conflict detection for ``events`` to run after the current
+    transaction commits, off the request path.
+    """
+    enqueue_on_commit(detect_conflicts_for_ids, [event.id for event in events])
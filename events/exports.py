@@ -0,0 +1,126 @@
+import csv
+import json
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from .recurrence import compile_rule
+
+EVENT_FIELDS = (
+    'id', 'title', 'description', 'location', 'start_time', 'end_time',
+    'is_recurring', 'recurrence_pattern', 'version', 'created_by_id',
+    'created_at', 'updated_at'
+)
+CHANGELOG_FIELDS = (
+    'id', 'change_type', 'changed_by_id', 'changed_at', 'version__version_number',
+    'changes', 'metadata'
+)
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'ics': 'text/calendar',
+}
+
+def rrule(pattern):
+    """
+    RRULE value for a stored pattern, or None when there is none or it
+    cannot be parsed.
+    """
+    if not pattern:
+        return None
+    try:
+        return compile_rule(pattern).to_rrule()
+    except ValueError:
+        return None
+
+def ndjson_lines(rows):
+    encoder = JSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+class _Echo:
+    # csv.writer target that hands each formatted row straight back
+    def write(self, value):
+        return value
+
+def csv_lines(rows, fields):
+    """
+    CSV with a header row. JSON columns are written as JSON, except
+    recurrence patterns, which use RRULE syntax so the file imports back.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        values = []
+        for field in fields:
+            value = row[field]
+            if field == 'recurrence_pattern':
+                value = rrule(value)
+            elif isinstance(value, (dict, list)):
+                value = json.dumps(value, cls=JSONEncoder)
+            elif hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append('' if value is None else value)
+        yield writer.writerow(values)
+
+def _ical_text(value):
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+def _ical_time(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def _ical_fold(line):
+    # Content lines are folded at 75 octets (RFC 5545 3.1)
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Never split a multi-byte character
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+def ical_lines(rows):
+    """
+    An iCalendar VCALENDAR with one VEVENT per event row.
+    """
+    yield _ical_fold('BEGIN:VCALENDAR')
+    yield _ical_fold('VERSION:2.0')
+    yield _ical_fold('PRODID:-//Event Scheduler//EN')
+    stamp = _ical_time(timezone.now())
+    for row in rows:
+        lines = [
+            'BEGIN:VEVENT',
+            f"UID:{row['id']}",
+            f'DTSTAMP:{stamp}',
+            f"DTSTART:{_ical_time(row['start_time'])}",
+            f"DTEND:{_ical_time(row['end_time'])}",
+            f"SUMMARY:{_ical_text(row['title'])}",
+            f"SEQUENCE:{row['version']}",
+            f"LAST-MODIFIED:{_ical_time(row['updated_at'])}",
+        ]
+        if row['description']:
+            lines.append(f"DESCRIPTION:{_ical_text(row['description'])}")
+        if row['location']:
+            lines.append(f"LOCATION:{_ical_text(row['location'])}")
+        rule = rrule(row['recurrence_pattern']) if row['is_recurring'] else None
+        if rule:
+            lines.append(f'RRULE:{rule}')
+        lines.append('END:VEVENT')
+        yield ''.join(_ical_fold(line) for line in lines)
+    yield _ical_fold('END:VCALENDAR')
+
+def export_lines(rows, export_format, fields):
+    if export_format == 'csv':
+        return csv_lines(rows, fields)
+    if export_format == 'ics':
+        return ical_lines(rows)
+    return ndjson_lines(rows)
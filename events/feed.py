@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from asgiref.sync import sync_to_async
+from django.db.models import Exists, Max, OuterRef
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+from .conf import events_setting
+from .models import EventChangeLog, EventPermission
+
+logger = logging.getLogger(__name__)
+
+FEED_FIELDS = (
+    'id', 'event_id', 'change_type', 'changed_by_id', 'changed_at', 'version__version_number',
+    'changes', 'metadata'
+)
+
+KEEPALIVE = ': keepalive\n\n'
+
+class MemorySubscription:
+    """
+    Frames published to one user in this process, waited on from either
+    a thread (WSGI) or an event loop (ASGI). A subscriber that falls more
+    than FEED_QUEUE_SIZE frames behind is cut off and resumes from its
+    last event id.
+    """
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.frames = deque()
+        self.overflowed = False
+        self.ready = threading.Condition()
+        self.loop = None
+        self.wakeup = None
+
+    def put(self, frame):
+        with self.ready:
+            if len(self.frames) >= events_setting('FEED_QUEUE_SIZE'):
+                self.overflowed = True
+            else:
+                self.frames.append(frame)
+            self.ready.notify()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def open(self):
+        self.broker.add(self)
+
+    def get(self, timeout):
+        with self.ready:
+            self.ready.wait_for(lambda: self.frames or self.overflowed, timeout)
+            return self.frames.popleft() if self.frames else None
+
+    def close(self):
+        self.broker.discard(self)
+
+    async def aopen(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.open()
+
+    async def aget(self, timeout):
+        # Cleared before looking, so a frame put in between still wakes us
+        self.wakeup.clear()
+        with self.ready:
+            if self.frames or self.overflowed:
+                return self.frames.popleft() if self.frames else None
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        with self.ready:
+            return self.frames.popleft() if self.frames else None
+
+    async def aclose(self):
+        self.close()
+
+class MemoryBroker:
+    """
+    Delivers frames to subscribers in the current process only; run with
+    RedisBroker when there is more than one.
+    """
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def add(self, subscription):
+        with self.lock:
+            self.subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+
+    def discard(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.user_id, None)
+
+    def active(self):
+        return bool(self.subscriptions)
+
+    def publish(self, user_id, frame):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(frame)
+
+    def subscribe(self, user_id):
+        return MemorySubscription(self, user_id)
+
+class RedisSubscription:
+    overflowed = False
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.channel = broker.channel(user_id)
+
+    def open(self):
+        self.pubsub = self.broker.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.channel)
+
+    def get(self, timeout):
+        message = self.pubsub.get_message(timeout=timeout)
+        return message['data'].decode() if message else None
+
+    def close(self):
+        self.pubsub.close()
+
+    async def aopen(self):
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(self.broker.url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.channel)
+
+    async def aget(self, timeout):
+        message = await self.pubsub.get_message(timeout=timeout)
+        return message['data'].decode() if message else None
+
+    async def aclose(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+class RedisBroker:
+    """
+    Publishes through Redis pub/sub (FEED_REDIS_URL), so subscribers
+    connected to any process see every change.
+    """
+
+    def __init__(self):
+        import redis
+
+        self.url = events_setting('FEED_REDIS_URL')
+        self.client = redis.Redis.from_url(self.url)
+
+    @staticmethod
+    def channel(user_id):
+        return f'events:feed:{user_id}'
+
+    def active(self):
+        return True
+
+    def publish(self, user_id, frame):
+        self.client.publish(self.channel(user_id), frame)
+
+    def subscribe(self, user_id):
+        return RedisSubscription(self, user_id)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(events_setting('FEED_BROKER'))()
+        return _broker
+
+def as_frame(row):
+    """
+    Server-Sent Events ``change`` frame for a FEED_FIELDS row of
+    EventChangeLog, carrying the entry as JSON.
+    """
+    data = {
+        'id': row['id'],
+        'event': row['event_id'],
+        'change_type': row['change_type'],
+        'changed_by': row['changed_by_id'],
+        'changed_at': row['changed_at'],
+        'version': row['version__version_number'],
+        'changes': row['changes'],
+        'metadata': row['metadata'],
+    }
+    return f"id: {row['id']}\nevent: change\ndata: {JSONEncoder().encode(data)}\n\n"
+
+def publish_changes(ids):
+    """
+    Send the changelog entries ``ids`` to everyone holding a permission on
+    their events. Subscribers that miss one catch up from their cursor, so
+    a failure here is logged rather than raised.
+    """
+    broker = get_broker()
+    if not ids or not broker.active():
+        return
+    try:
+        entries = EventChangeLog.objects.filter(pk__in=ids)
+        holders = {}
+        for event_id, user_id in EventPermission.objects.filter(
+            event__in=entries.values('event_id')
+        ).values_list('event_id', 'user_id'):
+            holders.setdefault(event_id, []).append(user_id)
+        for row in entries.order_by('pk').values(*FEED_FIELDS):
+            frame = as_frame(row)
+            for user_id in holders.get(row['event_id'], ()):
+                broker.publish(user_id, frame)
+    except Exception:
+        logger.exception('Could not publish changelog entries %s', ids)
+
+def frame_id(frame):
+    return int(frame[4:frame.index('\n')])
+
+def replay(user_id, cursor):
+    """
+    Up to EXPORT_CHUNK_SIZE ``(id, frame)`` pairs after ``cursor`` on the
+    events ``user_id`` holds a permission on.
+    """
+    rows = EventChangeLog.objects.filter(
+        Exists(EventPermission.objects.filter(event=OuterRef('event'), user_id=user_id)),
+        pk__gt=cursor
+    ).order_by('pk').values(*FEED_FIELDS)[:events_setting('EXPORT_CHUNK_SIZE')]
+    return [(row['id'], as_frame(row)) for row in rows]
+
+def latest_id():
+    return EventChangeLog.objects.aggregate(latest=Max('pk'))['latest'] or 0
+
+def stream(user_id, cursor, subscription):
+    """
+    The feed for WSGI servers: entries after ``cursor``, then live ones as
+    they are published, with a keepalive comment every FEED_HEARTBEAT
+    seconds. Live frames already replayed are skipped.
+    """
+    subscription.open()
+    try:
+        if cursor is None:
+            cursor = latest_id()
+        while True:
+            page = replay(user_id, cursor)
+            for cursor, frame in page:
+                yield frame
+            if len(page) < events_setting('EXPORT_CHUNK_SIZE'):
+                break
+        while not subscription.overflowed:
+            frame = subscription.get(events_setting('FEED_HEARTBEAT'))
+            if frame is None:
+                yield KEEPALIVE
+            elif frame_id(frame) > cursor:
+                yield frame
+    finally:
+        subscription.close()
+
+async def astream(user_id, cursor, subscription):
+    """
+    stream() for ASGI servers, where waiting for the next frame holds no
+    thread.
+    """
+    await subscription.aopen()
+    try:
+        if cursor is None:
+            cursor = await sync_to_async(latest_id)()
+        while True:
+            page = await sync_to_async(replay)(user_id, cursor)
+            for cursor, frame in page:
+                yield frame
+            if len(page) < events_setting('EXPORT_CHUNK_SIZE'):
+                break
+        while not subscription.overflowed:
+            frame = await subscription.aget(events_setting('FEED_HEARTBEAT'))
+            if frame is None:
+                yield KEEPALIVE
+            elif frame_id(frame) > cursor:
+                yield frame
+    finally:
+        await subscription.aclose()
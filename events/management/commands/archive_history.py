@@ -0,0 +1,95 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+from events.archive import store
+from events.audit import drain
+from events.conf import events_setting
+from events.models import EventArchive, EventChangeLog, EventVersion
+from events.versions import snapshots
+
+def month_of(value):
+    return value.date().replace(day=1)
+
+class Command(BaseCommand):
+    help = 'Move changelog entries and versions older than --days into EventArchive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=events_setting('ARCHIVE_AFTER_DAYS'),
+            help='Archive rows older than this many days'
+        )
+
+    def archive(self, event_id, kind, rows, when):
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(month_of(row[when]), []).append(row)
+        for month, month_rows in by_month.items():
+            store(event_id, kind, month, month_rows)
+
+    def archive_changelog(self, event_id, cutoff):
+        rows = list(EventChangeLog.objects.filter(
+            event_id=event_id, changed_at__lt=cutoff
+        ).order_by().values(
+            'id', 'change_type', 'changed_by_id', 'changed_at', 'version__version_number',
+            'changes', 'metadata'
+        ))
+        for row in rows:
+            row['version_number'] = row.pop('version__version_number')
+        self.archive(event_id, EventArchive.Kind.CHANGELOG, rows, 'changed_at')
+        EventChangeLog.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        return len(rows)
+
+    def archive_versions(self, event_id, cutoff):
+        versions = EventVersion.objects.filter(event_id=event_id)
+        # Keep the newest version, and every version a hot changelog entry
+        # points at, along with everything after them
+        bounds = versions.aggregate(
+            oldest=Min('version_number'), newest=Max('version_number')
+        )
+        keep = [
+            bounds['newest'],
+            versions.filter(created_at__gte=cutoff).aggregate(first=Min('version_number'))['first'],
+            EventChangeLog.objects.filter(event_id=event_id).aggregate(
+                first=Min('version__version_number')
+            )['first'],
+        ]
+        boundary = min(number for number in keep if number is not None)
+        if bounds['oldest'] >= boundary:
+            return 0
+
+        states = snapshots(event_id, bounds['oldest'], boundary)
+        rows = list(versions.filter(version_number__lt=boundary).order_by().values(
+            'id', 'version_number', 'delta', 'created_by_id', 'created_at', 'change_reason'
+        ))
+        for row in rows:
+            # Archived versions carry full snapshots, so each month reads on its own
+            row['data'] = states[row['version_number']]
+        self.archive(event_id, EventArchive.Kind.VERSIONS, rows, 'created_at')
+        versions.filter(version_number=boundary, data__isnull=True).update(data=states[boundary])
+        versions.filter(version_number__lt=boundary).delete()
+        return len(rows)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Pending outbox entries may already be past the cutoff
+        drain()
+
+        event_ids = set(EventChangeLog.objects.filter(
+            changed_at__lt=cutoff
+        ).order_by().values_list('event_id', flat=True).distinct())
+        event_ids |= set(EventVersion.objects.filter(
+            created_at__lt=cutoff, version_number__lt=F('event__version')
+        ).order_by().values_list('event_id', flat=True).distinct())
+
+        entries = versions = 0
+        for event_id in event_ids:
+            # One transaction per event keeps memory and lock time bounded
+            with transaction.atomic():
+                entries += self.archive_changelog(event_id, cutoff)
+                versions += self.archive_versions(event_id, cutoff)
+        self.stdout.write(
+            f'Archived {entries} changelog entries and {versions} versions '
+            f'from {len(event_ids)} events older than {cutoff.isoformat()}'
+        )
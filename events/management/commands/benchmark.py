@@ -0,0 +1,462 @@
+import gzip
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from types import SimpleNamespace
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.test import APIRequestFactory, force_authenticate
+from events.models import Event, EventPermission, EventVersion
+from events.bulk import bulk_create_events
+from events.conflicts import detect_event_conflicts
+from events.exports import EVENT_FIELDS, export_lines
+from events.occurrences import sync_occurrences
+from events.recurrence import RecurrenceRule, compile_rule
+from events.cache import response_cache
+from events.renderers import MessagePackRenderer
+from events.serializers import (
+    EventCreateSerializer, EventSerializer, EventVersionSerializer, represent_events
+)
+from events.versions import build_version, materialize, snapshot
+from events.views import EventViewSet
+
+@contextmanager
+def rolled_back():
+    """
+    Run a benchmark body in a transaction that is always rolled back,
+    so seeded rows never reach the database.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+def create_users(count, prefix='benchmark'):
+    User.objects.bulk_create([User(username=f'{prefix}-{i}') for i in range(count)])
+    return list(User.objects.filter(username__startswith=f'{prefix}-'))
+
+def seed_events(users, count, start, span_days=100, batch_size=5000):
+    """
+    Insert ``count`` 30-60 minute events over ``span_days``, each owned by
+    one of ``users`` picked at random.
+    """
+    rng = random.Random(count)
+    span = span_days * 24 * 60
+    for offset in range(0, count, batch_size):
+        batch = []
+        for _ in range(min(batch_size, count - offset)):
+            begin = start + timedelta(minutes=rng.randrange(span))
+            batch.append(Event(
+                title='Benchmark event',
+                start_time=begin,
+                end_time=begin + timedelta(minutes=rng.choice((30, 45, 60))),
+                created_by=rng.choice(users)
+            ))
+        Event.objects.bulk_create(batch)
+        EventPermission.objects.bulk_create([
+            EventPermission(event=event, user=event.created_by, role=EventPermission.Role.OWNER)
+            for event in batch
+        ])
+
+def summarize(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"mean={statistics.mean(samples):.2f}ms p99={p99:.2f}ms"
+
+def bench_conflicts(command, options):
+    """
+    Create latency (insert, occurrence rows and conflict detection) against
+    a populated table, with calendars of about 1000 events (ten a day) per user.
+    """
+    start = timezone.now()
+    for size in options['sizes']:
+        with rolled_back():
+            users = create_users(max(size // 1000, 1))
+            seed_events(users, size, start)
+            seeded = list(Event.objects.filter(title='Benchmark event'))
+            # In batches, under SQLite's limit on query parameters
+            for offset in range(0, len(seeded), 5000):
+                sync_occurrences(seeded[offset:offset + 5000])
+            rng = random.Random(size)
+            timings, queries = [], []
+            for _ in range(options['repeat']):
+                user = rng.choice(users)
+                begin = start + timedelta(minutes=rng.randrange(100 * 24 * 60))
+                reset_queries()
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    event = Event.objects.create(
+                        title='Probe',
+                        start_time=begin,
+                        end_time=begin + timedelta(hours=1),
+                        created_by=user
+                    )
+                    EventPermission.objects.create(
+                        event=event, user=user, role=EventPermission.Role.OWNER
+                    )
+                    sync_occurrences([event])
+                    detect_event_conflicts(event)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(ctx.captured_queries))
+            command.stdout.write(
+                f"conflicts n={size}: {summarize(timings)} queries={max(queries)}"
+            )
+
+def bench_list(command, options):
+    """
+    First-page list latency for a user who can see ``size`` shared events,
+    comparing the DISTINCT join with the EXISTS access path.
+    """
+    start = timezone.now()
+    for size in options['sizes']:
+        with rolled_back():
+            owners = create_users(max(size // 1000, 1))
+            reader = User.objects.create(username='benchmark-reader')
+            seed_events(owners, size, start)
+            shared = Event.objects.values_list('id', flat=True).iterator()
+            batch = []
+            for event_id in shared:
+                batch.append(EventPermission(event_id=event_id, user=reader))
+                if len(batch) == 5000:
+                    EventPermission.objects.bulk_create(batch)
+                    batch = []
+            EventPermission.objects.bulk_create(batch)
+
+            querysets = {
+                'distinct-join': Event.objects.filter(
+                    permissions__user=reader, is_deleted=False
+                ).distinct(),
+                'exists': Event.objects.visible_to(reader),
+            }
+            for label, queryset in querysets.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    list(queryset.order_by('-start_time', '-id')[:options['page_size']])
+                    timings.append((time.perf_counter() - started) * 1000)
+                command.stdout.write(f"list n={size} {label}: {summarize(timings)}")
+
+def bench_recurrence(command, options):
+    """
+    Microbenchmark of rule parsing (cold vs memoized) and of expanding a
+    year of a daily series.
+    """
+    pattern = 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR;UNTIL=20301231T000000Z'
+    stored = RecurrenceRule.from_pattern(pattern).to_pattern()
+    for size in options['sizes']:
+        cases = {
+            'parse': lambda: RecurrenceRule.from_pattern(pattern),
+            'compiled-text': lambda: compile_rule(pattern),
+            'compiled-json': lambda: compile_rule(stored),
+        }
+        for label, func in cases.items():
+            started = time.perf_counter()
+            for _ in range(size):
+                func()
+            elapsed = time.perf_counter() - started
+            command.stdout.write(f"recurrence {label} x{size}: {elapsed / size * 1e6:.2f}us/op")
+
+    rule = compile_rule('FREQ=DAILY')
+    start = timezone.now()
+    window_start = start + timedelta(days=3650)
+    timings = []
+    for _ in range(options['repeat']):
+        started = time.perf_counter()
+        list(rule.between(start, timedelta(hours=1), window_start, window_start + timedelta(days=365)))
+        timings.append((time.perf_counter() - started) * 1000)
+    command.stdout.write(f"recurrence expand daily year, 10y after start: {summarize(timings)}")
+
+def bench_batch(command, options):
+    """
+    End-to-end batch_create cost: validation plus the bulk insert path.
+    """
+    start = timezone.now()
+    for size in options['sizes']:
+        with rolled_back():
+            user = User.objects.create(username='benchmark')
+            request = SimpleNamespace(user=user)
+            items = [
+                {
+                    'title': f'Imported {i}',
+                    'start_time': (start + timedelta(minutes=30 * i)).isoformat(),
+                    'end_time': (start + timedelta(minutes=30 * i + 25)).isoformat(),
+                }
+                for i in range(size)
+            ]
+            reset_queries()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                serializer = EventCreateSerializer(data=items, many=True, context={'request': request})
+                serializer.is_valid(raise_exception=True)
+                validated = time.perf_counter()
+                bulk_create_events(serializer.validated_data, user)
+                finished = time.perf_counter()
+            command.stdout.write(
+                f"batch n={size}: validate={validated - started:.2f}s "
+                f"insert={finished - validated:.2f}s queries={len(ctx.captured_queries)}"
+            )
+
+def bench_export(command, options):
+    """
+    Streaming export throughput and peak Python memory per format; the
+    peak should stay flat as the table grows.
+    """
+    start = timezone.now()
+    for size in options['sizes']:
+        with rolled_back():
+            users = create_users(max(size // 1000, 1))
+            seed_events(users, size, start)
+            def export(export_format):
+                rows = Event.objects.filter(is_deleted=False).order_by('-start_time', '-id')
+                rows = rows.values(*EVENT_FIELDS).iterator(chunk_size=2000)
+                return sum(len(chunk) for chunk in export_lines(rows, export_format, EVENT_FIELDS))
+
+            for export_format in ('ndjson', 'csv', 'ics'):
+                started = time.perf_counter()
+                written = export(export_format)
+                elapsed = time.perf_counter() - started
+                # Memory is traced on a second pass since tracing slows allocation
+                tracemalloc.start()
+                export(export_format)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                command.stdout.write(
+                    f"export n={size} {export_format}: {elapsed:.2f}s "
+                    f"{written / 2 ** 20:.1f}MB written, peak={peak / 2 ** 20:.1f}MB"
+                )
+
+def bench_versions(command, options):
+    """
+    Bytes stored per edit and history page latency for an event with
+    ``size`` versions, stored as keyframes plus deltas versus a full
+    snapshot on every version.
+    """
+    start = timezone.now()
+    for size in options['sizes']:
+        with rolled_back():
+            user = User.objects.create(username='benchmark')
+            events = {}
+            for label in ('full-snapshots', 'deltas'):
+                event = Event.objects.create(
+                    title='Edit 0', start_time=start, end_time=start + timedelta(hours=1),
+                    created_by=user
+                )
+                EventPermission.objects.create(event=event, user=user, role=EventPermission.Role.OWNER)
+                events[label] = event
+
+            # The old layout stored the nested EventSerializer output, whose
+            # current_version embeds the previous document; only its size is tracked
+            event = events['full-snapshots']
+            event.latest_versions = []
+            base = len(json.dumps(EventSerializer(event).data, cls=JSONEncoder))
+            nested = sum(base * number for number in range(1, size + 1))
+
+            rows = {'full-snapshots': [], 'deltas': []}
+            previous = None
+            for number in range(1, size + 1):
+                for label, event in events.items():
+                    event.title = f'Edit {number}'
+                    event.version = number
+                    current = snapshot(event)
+                    if label == 'deltas':
+                        rows[label].append(build_version(event, previous, current, user))
+                    else:
+                        rows[label].append(EventVersion(
+                            event=event, version_number=number, data=current, created_by=user
+                        ))
+                previous = current
+            for label, versions in rows.items():
+                EventVersion.objects.bulk_create(versions, batch_size=500)
+                stored = sum(
+                    len(json.dumps(version.data)) + len(json.dumps(version.delta))
+                    for version in versions
+                )
+                command.stdout.write(f"versions n={size} {label}: {stored / size:.0f} bytes/edit")
+            command.stdout.write(f"versions n={size} nested (old layout): {nested / size:.0f} bytes/edit")
+
+            for label, event in events.items():
+                for offset in (0, size // 2):
+                    timings = []
+                    for _ in range(options['repeat']):
+                        started = time.perf_counter()
+                        page = list(
+                            EventVersion.objects.filter(event=event, version_number__lte=size - offset)
+                            .select_related('created_by').order_by('-version_number')[:options['page_size']]
+                        )
+                        materialize(page)
+                        EventVersionSerializer(page, many=True).data
+                        timings.append((time.perf_counter() - started) * 1000)
+                    command.stdout.write(
+                        f"versions n={size} {label} history page at {size - offset}: {summarize(timings)}"
+                    )
+
+def bench_freebusy(command, options):
+    """
+    POST /api/events/freebusy/ for ``size`` users over one month, with
+    about four events per user a day, a third of them shared with two
+    other users.
+    """
+    start = timezone.now()
+    view = EventViewSet.as_view({'post': 'freebusy'}, throttle_classes=[])
+    factory = APIRequestFactory()
+    for size in options['sizes']:
+        with rolled_back():
+            users = create_users(size)
+            seed_events(users, size * 120, start, span_days=30)
+            rng = random.Random(size)
+            events = list(Event.objects.filter(title='Benchmark event'))
+            EventPermission.objects.bulk_create([
+                EventPermission(event=event, user=user, role=EventPermission.Role.VIEWER)
+                for event in events[::3]
+                for user in rng.sample(users, 2)
+                if user != event.created_by
+            ], ignore_conflicts=True)
+            sync_occurrences(events)
+
+            body = {
+                'users': [user.pk for user in users],
+                'start': start.isoformat(),
+                'end': (start + timedelta(days=30)).isoformat(),
+            }
+            timings = []
+            for _ in range(options['repeat']):
+                request = factory.post('/api/events/freebusy/', body, format='json')
+                force_authenticate(request, users[0])
+                started = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+            busy = sum(len(intervals) for intervals in response.data['busy'].values())
+            command.stdout.write(
+                f"freebusy users={size} month: {summarize(timings)} "
+                f"busy intervals={busy} free={len(response.data['free'])}"
+            )
+
+def bench_slots(command, options):
+    """
+    POST /api/events/slots/ for ``size`` participants over a quarter, each
+    with about three events a working day.
+    """
+    start = timezone.now()
+    view = EventViewSet.as_view({'post': 'slots'}, throttle_classes=[])
+    factory = APIRequestFactory()
+    for size in options['sizes']:
+        with rolled_back():
+            users = create_users(size)
+            seed_events(users, size * 270, start, span_days=90)
+            sync_occurrences(Event.objects.filter(title='Benchmark event'))
+
+            for duration, count in ((30, 10), (120, 50)):
+                body = {
+                    'users': [user.pk for user in users],
+                    'start': start.isoformat(),
+                    'end': (start + timedelta(days=90)).isoformat(),
+                    'duration': duration,
+                    'count': count,
+                }
+                timings = []
+                for _ in range(options['repeat']):
+                    request = factory.post('/api/events/slots/', body, format='json')
+                    force_authenticate(request, users[0])
+                    started = time.perf_counter()
+                    response = view(request)
+                    response.render()
+                    timings.append((time.perf_counter() - started) * 1000)
+                slots = response.data['slots']
+                command.stdout.write(
+                    f"slots users={size} quarter duration={duration}m count={count}: "
+                    f"{summarize(timings)} found={len(slots)}"
+                    + (f" last={slots[-1]['start'] - start}" if slots else '')
+                )
+
+def bench_msgpack(command, options):
+    """
+    Server CPU and payload size of a ``size``-event list page as JSON and
+    as MessagePack: building the rows (EventSerializer against
+    represent_events), rendering them, and the whole view.
+    """
+    start = timezone.now()
+    view = EventViewSet.as_view({'get': 'list'}, throttle_classes=[])
+    factory = APIRequestFactory()
+    renderers = {'json': JSONRenderer(), 'msgpack': MessagePackRenderer()}
+    for size in options['sizes']:
+        with rolled_back():
+            owner = create_users(1)[0]
+            seed_events([owner], size, start)
+            events = list(EventViewSet().with_related(Event.objects.filter(created_by=owner)))
+            builders = {
+                'serializer': lambda: EventSerializer(events, many=True).data,
+                'represent_events': lambda: represent_events(events),
+            }
+
+            for label, build in builders.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.process_time()
+                    build()
+                    timings.append((time.process_time() - started) * 1000)
+                command.stdout.write(f"msgpack n={size} build {label}: {summarize(timings)}")
+
+            rows = represent_events(events)
+            for label, renderer in renderers.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.process_time()
+                    payload = renderer.render(rows)
+                    timings.append((time.process_time() - started) * 1000)
+                command.stdout.write(
+                    f"msgpack n={size} render {label}: {summarize(timings)} bytes={len(payload)} "
+                    f"gzip={len(gzip.compress(payload))}"
+                )
+
+            for label, renderer in renderers.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    response_cache().clear()
+                    request = factory.get(
+                        '/api/events/', {'page_size': size}, HTTP_ACCEPT=renderer.media_type
+                    )
+                    force_authenticate(request, owner)
+                    started = time.process_time()
+                    response = view(request)
+                    response.render()
+                    timings.append((time.process_time() - started) * 1000)
+                command.stdout.write(
+                    f"msgpack n={size} view {label}: {summarize(timings)} bytes={len(response.content)}"
+                )
+
+SCENARIOS = {
+    'conflicts': (bench_conflicts, [10000, 100000, 1000000]),
+    'list': (bench_list, [50000]),
+    'recurrence': (bench_recurrence, [100000]),
+    'batch': (bench_batch, [10000]),
+    'export': (bench_export, [10000, 100000]),
+    'versions': (bench_versions, [1000]),
+    'freebusy': (bench_freebusy, [20, 100]),
+    'slots': (bench_slots, [12, 48]),
+    'msgpack': (bench_msgpack, [1000]),
+}
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks inside a rolled back transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--sizes', type=int, nargs='+')
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        func, default_sizes = SCENARIOS[options['scenario']]
+        options['sizes'] = options['sizes'] or default_sizes
+        func(self, options)
@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from events.audit import drain
+
+class Command(BaseCommand):
+    help = 'Move pending changelog entries from the outbox into EventChangeLog'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Moved {drain()} changelog entries')
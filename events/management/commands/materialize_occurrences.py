@@ -0,0 +1,47 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from events.conf import events_setting
+from events.models import Event
+from events.occurrences import extend_occurrences, sync_occurrences
+
+class Command(BaseCommand):
+    help = 'Materialize event occurrences and roll the recurring horizon forward'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=events_setting('OCCURRENCE_HORIZON_DAYS'),
+            help='Horizon to materialize up to, in days from now'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def process(self, queryset, apply, batch_size):
+        # Processed events drop out of ``queryset``, so keep taking the head
+        total = 0
+        while True:
+            with transaction.atomic():
+                batch = list(queryset[:batch_size])
+                if not batch:
+                    return total
+                apply(batch)
+            total += len(batch)
+
+    def handle(self, *args, **options):
+        horizon = timezone.now() + timedelta(days=options['days'])
+        live = Event.objects.filter(is_deleted=False).order_by()
+
+        # Events that predate the occurrence table
+        created = self.process(
+            live.filter(occurrences_until__isnull=True),
+            lambda batch: sync_occurrences(batch, horizon),
+            options['batch_size']
+        )
+        self.stdout.write(f'Materialized {created} events')
+
+        extended = self.process(
+            live.filter(is_recurring=True, occurrences_until__lt=horizon),
+            lambda batch: extend_occurrences(batch, horizon),
+            options['batch_size']
+        )
+        self.stdout.write(f'Extended {extended} recurring events to {horizon.isoformat()}')
@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import F, Max, Min
+from events.conflicts import prune_conflicts, sweep_conflicts
+from events.models import EventConflict, EventOccurrence
+
+def run(func, *args):
+    # Pool processes keep no connection open between ranges
+    try:
+        return func(*args)
+    finally:
+        connection.close()
+
+class Command(BaseCommand):
+    help = 'Recompute EventConflict from the live events, in parallel ranges'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Processes to spread the ranges over; 1 runs them in this process'
+        )
+        parser.add_argument(
+            '--chunk-days', type=int, default=7,
+            help='Days of occurrences swept per range'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Existing conflicts checked per range'
+        )
+
+    def run_ranges(self, label, func, ranges, workers):
+        """
+        Apply ``func`` to each range, reporting progress as they finish.
+        Returns the sum of what the calls returned.
+        """
+        if workers <= 1:
+            counts = (func(*bounds) for bounds in ranges)
+            return self.report(label, counts, len(ranges))
+        # Forked processes must not share this process' connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run, func, *bounds) for bounds in ranges]
+            counts = (future.result() for future in as_completed(futures))
+            return self.report(label, counts, len(ranges))
+
+    def report(self, label, counts, total_ranges):
+        total = 0
+        for done, count in enumerate(counts, 1):
+            total += count
+            self.stdout.write(f'{label}: {done}/{total_ranges} ranges, {total} so far')
+        return total
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--chunk-days and --batch-size must be at least 1')
+        # Conflicts are read from the occurrence table, so bring it up to date first
+        call_command('materialize_occurrences', stdout=self.stdout)
+
+        bounds = EventConflict.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        ranges = []
+        if bounds['first'] is not None:
+            ranges = [
+                (first, first + options['batch_size'])
+                for first in range(bounds['first'], bounds['last'] + 1, options['batch_size'])
+            ]
+        removed = self.run_ranges('Pruned', prune_conflicts, ranges, options['workers'])
+
+        # Bounds only; deleted events have no occurrences left to widen them
+        bounds = EventOccurrence.objects.aggregate(
+            first=Min('start_time'), last=Max('start_time'),
+            longest=Max(F('end_time') - F('start_time'))
+        )
+        ranges = []
+        if bounds['first'] is not None:
+            step = timedelta(days=options['chunk_days'])
+            start = bounds['first']
+            while start <= bounds['last']:
+                ranges.append((start, start + step, bounds['longest']))
+                start += step
+        added = self.run_ranges('Swept', sweep_conflicts, ranges, options['workers'])
+
+        self.stdout.write(f'Removed {removed} stale conflicts and added {added} missing ones')
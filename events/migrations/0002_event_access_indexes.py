@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-start_time', '-id'], name='events_event_live_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventpermission',
+            index=models.Index(fields=['user', 'event'], name='events_even_user_id_f4e2f0_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def canonicalize_patterns(apps, schema_editor):
+    from events.recurrence import RecurrenceRule
+
+    Event = apps.get_model('events', 'Event')
+    updates = []
+    for pk, stored in Event.objects.filter(recurrence_pattern__isnull=False).values_list('pk', 'recurrence_pattern'):
+        try:
+            pattern = RecurrenceRule.from_pattern(stored).to_pattern()
+        except (TypeError, ValueError):
+            # Leave unparseable patterns for a human; they expand as single events
+            continue
+        if pattern != stored:
+            updates.append((pk, pattern))
+    for pk, pattern in updates:
+        Event.objects.filter(pk=pk).update(recurrence_pattern=pattern)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_event_occurrences'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_patterns, migrations.RunPython.noop),
+    ]
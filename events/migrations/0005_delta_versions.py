@@ -0,0 +1,91 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+def to_deltas(apps, schema_editor):
+    """
+    Rewrite each event's versions as flat snapshots of the state *after*
+    that version, stored as keyframes plus deltas.
+
+    Old rows held the full serialized event as it was *before* the edit
+    (except rollbacks, which held the state they restored), so the state
+    after version N is usually found on version N + 1.
+    """
+    from events.utils import generate_diff
+    from events.versions import VERSIONED_FIELDS, is_keyframe, snapshot
+
+    Event = apps.get_model('events', 'Event')
+    EventVersion = apps.get_model('events', 'EventVersion')
+    EventChangeLog = apps.get_model('events', 'EventChangeLog')
+
+    def flat(data):
+        return {field: data[field] for field in VERSIONED_FIELDS if field in (data or {})}
+
+    # Collect ids up front; SQLite cannot update rows under an open cursor
+    event_ids = list(EventVersion.objects.order_by().values_list('event_id', flat=True).distinct())
+    for event_id in event_ids:
+        event = Event.objects.get(pk=event_id)
+        versions = list(EventVersion.objects.filter(event=event).order_by('version_number'))
+        changes = dict(EventChangeLog.objects.filter(
+            version__in=versions, change_type='UPDATE'
+        ).values_list('version_id', 'changes'))
+
+        states = []
+        for index, version in enumerate(versions):
+            following = versions[index + 1] if index + 1 < len(versions) else None
+            if version.change_reason.startswith('Rolled back to version'):
+                state = flat(version.data)
+            elif following is None:
+                state = snapshot(event)
+            elif not following.change_reason.startswith('Rolled back to version'):
+                state = flat(following.data)
+            else:
+                # Replay this edit's changelog diff over the state before it
+                state = flat(version.data)
+                for key, change in (changes.get(version.pk) or {}).get('modified', {}).items():
+                    if key in VERSIONED_FIELDS:
+                        state[key] = change['new']
+            states.append(state)
+
+        previous = None
+        for version, state in zip(versions, states):
+            keyframe = previous is None or is_keyframe(version.version_number)
+            version.data = state if keyframe else None
+            version.delta = None if previous is None else generate_diff(previous, state)
+            previous = state
+        EventVersion.objects.bulk_update(versions, ['data', 'delta'], batch_size=500)
+
+def to_snapshots(apps, schema_editor):
+    from events.versions import apply_delta
+
+    EventVersion = apps.get_model('events', 'EventVersion')
+    event_ids = list(EventVersion.objects.order_by().values_list('event_id', flat=True).distinct())
+    for event_id in event_ids:
+        versions = list(EventVersion.objects.filter(event_id=event_id).order_by('version_number'))
+        state = None
+        for version in versions:
+            state = dict(version.data) if version.data is not None else apply_delta(state, version.delta)
+            version.data = dict(state)
+        EventVersion.objects.bulk_update(versions, ['data'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_canonical_recurrence_patterns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventversion',
+            name='delta',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='eventversion',
+            name='data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(to_deltas, to_snapshots),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_delta_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.UUIDField()),
+                ('version_id', models.IntegerField()),
+                ('change_type', models.CharField(choices=[('CREATE', 'Create'), ('UPDATE', 'Update'), ('DELETE', 'Delete'), ('SHARE', 'Share'), ('PERMISSION_CHANGE', 'Permission Change')], max_length=20)),
+                ('changed_by_id', models.IntegerField()),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('changes', models.JSONField()),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='eventchangelog',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
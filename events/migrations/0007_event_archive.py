@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-18 10:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0006_changelog_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('changelog', 'Changelog'), ('versions', 'Versions')], max_length=10)),
+                ('month', models.DateField()),
+                ('row_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='events.event')),
+            ],
+            options={
+                'ordering': ['-month'],
+                'unique_together': {('event', 'kind', 'month')},
+            },
+        ),
+    ]
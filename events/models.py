@@ -1,11 +1,30 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
 from django.contrib.postgres.fields import ArrayField
 import uuid
 import json
 
+class EventQuerySet(models.QuerySet):
+    def shared_with(self, user):
+        """
+        Events ``user`` holds any permission on, deleted ones included.
+        Drives from the (user, event) index on EventPermission through an
+        EXISTS subquery, so no join fan-out or DISTINCT over wide event
+        rows is needed.
+        """
+        return self.filter(
+            models.Exists(EventPermission.objects.filter(event=models.OuterRef('pk'), user=user))
+        )
+
+    def visible_to(self, user):
+        """
+        Live events ``user`` holds any permission on.
+        """
+        return self.shared_with(user).filter(is_deleted=False)
+
 class Event(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=200)
@@ -20,17 +39,44 @@ class Event(models.Model):
     recurrence_pattern = models.JSONField(null=True, blank=True)
     version = models.IntegerField(default=1)
     is_deleted = models.BooleanField(default=False)
+    # Occurrences starting before this instant are materialized in EventOccurrence;
+    # a single event's one occurrence always is, wherever it falls
+    occurrences_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = EventQuerySet.as_manager()
 
     class Meta:
         ordering = ['-start_time']
         indexes = [
             models.Index(fields=['start_time', 'end_time']),
             models.Index(fields=['created_by']),
+            models.Index(
+                fields=['-start_time', '-id'],
+                condition=models.Q(is_deleted=False),
+                name='events_event_live_start_idx'
+            ),
+            # Seek index for GET /api/events/sync/
+            models.Index(fields=['updated_at', 'id'], name='events_event_updated_idx'),
         ]
 
     def __str__(self):
         return f"{self.title} ({self.start_time})"
 
+class EventOccurrence(models.Model):
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='occurrences')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+
+    class Meta:
+        ordering = ['start_time']
+        indexes = [
+            models.Index(fields=['start_time', 'end_time']),
+            models.Index(fields=['event', 'start_time']),
+        ]
+
+    def __str__(self):
+        return f"{self.event.title} ({self.start_time})"
+
 class EventPermission(models.Model):
     class Role(models.TextChoices):
         OWNER = 'OWNER', _('Owner')
@@ -47,6 +93,7 @@ class EventPermission(models.Model):
         unique_together = ('event', 'user')
         indexes = [
             models.Index(fields=['event', 'user']),
+            models.Index(fields=['user', 'event']),
         ]
 
     def __str__(self):
@@ -55,7 +102,10 @@ class EventPermission(models.Model):
 class EventVersion(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='versions')
     version_number = models.IntegerField()
-    data = models.JSONField()
+    # Full snapshot on keyframes only; see events.versions
+    data = models.JSONField(null=True, blank=True)
+    # generate_diff from the previous version's snapshot
+    delta = models.JSONField(null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     change_reason = models.TextField(blank=True)
@@ -81,7 +131,8 @@ class EventChangeLog(models.Model):
     version = models.ForeignKey(EventVersion, on_delete=models.CASCADE, related_name='changelog_entries')
     change_type = models.CharField(max_length=20, choices=ChangeType.choices)
     changed_by = models.ForeignKey(User, on_delete=models.CASCADE)
-    changed_at = models.DateTimeField(auto_now_add=True)
+    # Set when the change is made, which may be before the row is written
+    changed_at = models.DateTimeField(default=timezone.now)
     changes = models.JSONField()  # Stores the diff of changes
     metadata = models.JSONField(default=dict, blank=True)
 
@@ -95,6 +146,63 @@ class EventChangeLog(models.Model):
     def __str__(self):
         return f"{self.change_type} - {self.event.title} - {self.changed_at}"
 
+class ChangeLogOutbox(models.Model):
+    """
+    Changelog entries written inside the changing transaction and moved
+    into EventChangeLog in batches afterwards (see events.audit). Plain
+    ids and no secondary indexes keep the insert cheap.
+    """
+    event_id = models.UUIDField()
+    version_id = models.IntegerField()
+    change_type = models.CharField(max_length=20, choices=EventChangeLog.ChangeType.choices)
+    changed_by_id = models.IntegerField()
+    changed_at = models.DateTimeField(default=timezone.now)
+    changes = models.JSONField()
+    metadata = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.change_type} - {self.event_id} - {self.changed_at}"
+
+class EventArchive(models.Model):
+    """
+    One month of an event's changelog entries or versions, moved out of
+    the hot tables by ``manage.py archive_history``. ``payload`` holds the
+    rows as zlib-compressed msgpack (see events.archive).
+    """
+    class Kind(models.TextChoices):
+        CHANGELOG = 'changelog', _('Changelog')
+        VERSIONS = 'versions', _('Versions')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='archives')
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    month = models.DateField()  # First day of the month
+    row_count = models.PositiveIntegerField()
+    payload = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('event', 'kind', 'month')
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.kind} - {self.event_id} - {self.month:%Y-%m}"
+
+class EventCollection(models.Model):
+    """
+    A per-user token moved by every write to an event the user holds a
+    permission on (see events.cache.touch_collections), so the list ETag
+    is one primary key read however many events the user can see.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='event_collection'
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.version}"
+
 class EventConflict(models.Model):
     class ResolutionStatus(models.TextChoices):
         PENDING = 'PENDING', _('Pending')
@@ -0,0 +1,82 @@
+from datetime import timedelta
+from django.utils import timezone
+from .conf import events_setting
+from .models import Event, EventOccurrence
+from .recurrence import compile_rule
+
+# Fields whose change invalidates an event's materialized occurrences
+SCHEDULE_FIELDS = ('start_time', 'end_time', 'is_recurring', 'recurrence_pattern')
+
+def occurrence_horizon():
+    return timezone.now() + timedelta(days=events_setting('OCCURRENCE_HORIZON_DAYS'))
+
+def get_rule(event):
+    """
+    Return the event's RecurrenceRule, or None for single events and
+    patterns that cannot be parsed.
+    """
+    if not event.is_recurring or not event.recurrence_pattern:
+        return None
+    try:
+        return compile_rule(event.recurrence_pattern)
+    except ValueError:
+        return None
+
+def build_occurrences(event, start, end):
+    """
+    Unsaved EventOccurrence rows for occurrences of ``event`` that begin in
+    [start, end). A single event gets its one row from any ``start`` at or
+    before it, however far past ``end`` it is, since nothing rolls the
+    horizon forward for it later.
+    """
+    rule = get_rule(event)
+    if rule is None:
+        if start <= event.start_time:
+            return [EventOccurrence(event=event, start_time=event.start_time, end_time=event.end_time)]
+        return []
+    duration = event.end_time - event.start_time
+    return [
+        EventOccurrence(event=event, start_time=occurrence, end_time=occurrence + duration)
+        for occurrence in rule.starts(event.start_time, start, end)
+    ]
+
+def schedule_changed(old_event, new_event):
+    return any(
+        getattr(old_event, field) != getattr(new_event, field) for field in SCHEDULE_FIELDS
+    )
+
+def sync_occurrences(events, horizon=None):
+    """
+    Rebuild the materialized occurrences of ``events`` up to ``horizon``.
+    Call whenever an event's schedule fields change.
+    """
+    events = list(events)
+    if not events:
+        return
+    horizon = horizon or occurrence_horizon()
+    EventOccurrence.objects.filter(event__in=events).delete()
+    rows = []
+    for event in events:
+        if not event.is_deleted:
+            rows.extend(build_occurrences(event, event.start_time, horizon))
+    EventOccurrence.objects.bulk_create(rows, batch_size=1000)
+    Event.objects.filter(pk__in=[event.pk for event in events]).update(occurrences_until=horizon)
+    for event in events:
+        event.occurrences_until = horizon
+
+def extend_occurrences(events, horizon):
+    """
+    Materialize occurrences of recurring ``events`` from where each one
+    left off up to ``horizon``.
+    """
+    rows = []
+    for event in events:
+        # A pattern that does not parse leaves a single event, whose row sync wrote
+        if get_rule(event) is not None:
+            rows.extend(build_occurrences(event, event.occurrences_until, horizon))
+    EventOccurrence.objects.bulk_create(rows, batch_size=1000)
+    Event.objects.filter(pk__in=[event.pk for event in events]).update(occurrences_until=horizon)
+    return len(rows)
+
+def clear_occurrences(event):
+    EventOccurrence.objects.filter(event=event).delete()
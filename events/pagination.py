@@ -0,0 +1,162 @@
+import base64
+import json
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from itertools import islice
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a fixed ordering that ends in a unique
+    column. The cursor carries the sort key of the last row served, so each
+    page is an index range scan starting at that key instead of an OFFSET
+    scan, and page N costs the same as page 1.
+    """
+    ordering = None
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_fields(self):
+        return [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            fields = self.get_fields()
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, descending), value in zip(fields, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_token(self, row):
+        values = [
+            _encode_value(row[name] if isinstance(row, dict) else getattr(row, name))
+            for name, descending in self.get_fields()
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode('ascii')).decode('ascii')
+
+    def encode_cursor(self, row):
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_token(row))
+
+    def seek_filter(self, values):
+        """
+        Build the row-value comparison "sort key is after ``values``" as
+        (a < x) OR (a = x AND b < y) ..., honouring each field's direction.
+        The redundant bound on the leading column lets the planner turn the
+        OR into a single index range.
+        """
+        fields = self.get_fields()
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(fields, values):
+            lookup = f"{name}__{'lt' if descending else 'gt'}"
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        name, descending = fields[0]
+        return Q(**{f"{name}__{'lte' if descending else 'gte'}": values[0]}) & condition
+
+    def follows(self, row, values):
+        """
+        Whether ``row`` sorts after the sort key ``values``.
+        """
+        for (name, descending), value in zip(self.get_fields(), values):
+            current = getattr(row, name)
+            if current != value:
+                return current < value if descending else current > value
+        return False
+
+    def paginate_queryset(self, queryset, request, view=None, archived=None):
+        """
+        ``archived`` optionally continues the queryset: an iterable of
+        instances in the same order, all sorting after its last row.
+        """
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.cursor_query_param
+        )
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.seek_filter(cursor))
+
+        rows = list(queryset[:page_size + 1])
+        if archived is not None and len(rows) <= page_size:
+            if cursor is not None:
+                archived = (row for row in archived if self.follows(row, cursor))
+            rows += islice(archived, page_size + 1 - len(rows))
+        self.page = rows[:page_size]
+        self.has_next = len(rows) > page_size
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+class EventCursorPagination(KeysetPagination):
+    ordering = ('-start_time', '-id')
+
+class VersionCursorPagination(KeysetPagination):
+    ordering = ('-version_number',)
+
+class ChangeLogCursorPagination(KeysetPagination):
+    ordering = ('-changed_at', '-id')
+
+class ConflictCursorPagination(KeysetPagination):
+    ordering = ('-detected_at', '-id')
+
+class SyncPagination(KeysetPagination):
+    ordering = ('updated_at', 'id')
+    cursor_query_param = 'since'
+    max_page_size = 5000
@@ -0,0 +1,80 @@
+import codecs
+import csv
+import json
+import uuid
+import msgpack
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from .renderers import MSGPACK_UUID
+
+class StreamingParser(BaseParser):
+    """
+    Parses the request body lazily: ``request.data`` is a generator that
+    reads and yields one row at a time. Rows that cannot be parsed are
+    yielded as ParseError instances so the caller can report them and
+    carry on.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if stream is None:
+            return iter(())
+        return self.rows(codecs.iterdecode(stream, encoding))
+
+    def rows(self, lines):
+        raise NotImplementedError('.rows() must be overridden.')
+
+class NDJSONParser(StreamingParser):
+    """
+    One JSON object per line; blank lines are skipped.
+    """
+    media_type = 'application/x-ndjson'
+
+    def rows(self, lines):
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield ParseError(f'Line {number}: invalid JSON - {exc}')
+
+class CSVParser(StreamingParser):
+    """
+    A header row followed by one event per row. Empty cells are left out
+    so serializer defaults apply.
+    """
+    media_type = 'text/csv'
+
+    def rows(self, lines):
+        reader = csv.DictReader(lines)
+        try:
+            for row in reader:
+                if None in row:
+                    yield ParseError(f'Line {reader.line_num}: more cells than columns')
+                    continue
+                yield {key: value for key, value in row.items() if value not in (None, '')}
+        except csv.Error as exc:
+            yield ParseError(f'Line {reader.line_num}: {exc}')
+
+class MessagePackParser(BaseParser):
+    """
+    ``application/msgpack`` request bodies, with the extension types
+    MessagePackRenderer writes: timestamps become aware datetimes and
+    MSGPACK_UUID values UUIDs.
+    """
+    media_type = 'application/msgpack'
+
+    @staticmethod
+    def decode(code, data):
+        if code == MSGPACK_UUID:
+            return uuid.UUID(bytes=data)
+        return msgpack.ExtType(code, data)
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), timestamp=3, ext_hook=self.decode)
+        except ValueError as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
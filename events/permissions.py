@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .cache import get_role
 from .models import EventPermission
 
 class HasEventPermission(permissions.BasePermission):
@@ -10,18 +11,17 @@ class HasEventPermission(permissions.BasePermission):
             return True
 
         # Check if user has any permission for the event
-        try:
-            permission = obj.permissions.get(user=request.user)
-            
-            # For read operations, any role is sufficient
-            if request.method in permissions.SAFE_METHODS:
-                return True
-
-            # For write operations, only owners and editors can proceed
-            return permission.role in [EventPermission.Role.OWNER, EventPermission.Role.EDITOR]
-        except EventPermission.DoesNotExist:
+        role = get_role(request, obj)
+        if role is None:
             return False
 
+        # For read operations, any role is sufficient
+        if request.method in permissions.SAFE_METHODS:
+            return True
+
+        # For write operations, only owners and editors can proceed
+        return role in [EventPermission.Role.OWNER, EventPermission.Role.EDITOR]
+
 class IsEventOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
@@ -32,11 +32,7 @@ class IsEventOwner(permissions.BasePermission):
             return True
 
         # Check if user is the owner
-        try:
-            permission = obj.permissions.get(user=request.user)
-            return permission.role == EventPermission.Role.OWNER
-        except EventPermission.DoesNotExist:
-            return False
+        return get_role(request, obj) == EventPermission.Role.OWNER
 
 class IsEventOwnerOrEditor(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -48,8 +44,5 @@ class IsEventOwnerOrEditor(permissions.BasePermission):
             return True
 
         # Check if user is owner or editor
-        try:
-            permission = obj.permissions.get(user=request.user)
-            return permission.role in [EventPermission.Role.OWNER, EventPermission.Role.EDITOR]
-        except EventPermission.DoesNotExist:
-            return False 
+        return get_role(request, obj) in [EventPermission.Role.OWNER, EventPermission.Role.EDITOR]
+
@@ -0,0 +1,321 @@
+import calendar
+import math
+from collections import namedtuple
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+
+Occurrence = namedtuple('Occurrence', ('event_id', 'start', 'end'))
+
+def _parse_until(value):
+    if isinstance(value, datetime):
+        until = value
+    else:
+        value = str(value)
+        until = None
+        for fmt in ('%Y%m%dT%H%M%SZ', '%Y%m%dT%H%M%S', '%Y%m%d'):
+            try:
+                until = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        if until is None:
+            until = parse_datetime(value)
+        if until is None:
+            raise ValueError(f'Invalid UNTIL value: {value}')
+    if timezone.is_naive(until):
+        until = until.replace(tzinfo=dt_timezone.utc)
+    return until
+
+def _positive_int(value, name):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = 0
+    if value < 1:
+        raise ValueError(f'{name} must be a positive integer')
+    return value
+
+def _add_months(value, months):
+    """
+    Shift ``value`` by ``months``, or return None when the day of month
+    does not exist in the target month (such dates are skipped, per RFC 5545).
+    """
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    if value.day > calendar.monthrange(year, month)[1]:
+        return None
+    return value.replace(year=year, month=month)
+
+def _periods_with_day(dtstart, months, periods):
+    """
+    How many of the first ``periods`` periods of ``months`` months from
+    ``dtstart`` land in a month that has ``dtstart``'s day. Every
+    ``cycle`` periods the series is back in the same calendar month, so
+    each calendar month is counted at once; only Februaries are checked
+    year by year for a 29th.
+    """
+    cycle = 12 // math.gcd(months, 12)
+    total = 0
+    for first in range(min(cycle, periods)):
+        count = (periods - first + cycle - 1) // cycle
+        month = dtstart.month - 1 + first * months
+        year, month = dtstart.year + month // 12, month % 12 + 1
+        if month != 2:
+            # Outside February a month's length never changes
+            if dtstart.day <= calendar.monthrange(dtstart.year, month)[1]:
+                total += count
+        elif dtstart.day == 29:
+            years = cycle * months // 12
+            total += sum(1 for step in range(count) if calendar.isleap(year + step * years))
+    return total
+
+class RecurrenceRule:
+    """
+    The subset of RFC 5545 RRULE the scheduler understands: FREQ, INTERVAL,
+    COUNT, UNTIL and BYDAY (for DAILY and WEEKLY rules).
+
+    Expansion starts at the first period that can reach the requested window
+    instead of walking from the series start, so the cost is proportional to
+    the occurrences returned.
+    """
+    __slots__ = ('freq', 'interval', 'byday', 'count', 'until')
+
+    def __init__(self, freq, interval=1, byday=None, count=None, until=None):
+        self.freq = freq
+        self.interval = interval
+        self.byday = byday
+        self.count = count
+        self.until = until
+
+    def __repr__(self):
+        return f'<RecurrenceRule {self.to_pattern()}>'
+
+    def to_pattern(self):
+        """
+        Canonical JSON form stored in Event.recurrence_pattern.
+        """
+        pattern = {'FREQ': self.freq, 'INTERVAL': self.interval}
+        if self.byday:
+            pattern['BYDAY'] = [WEEKDAYS[day] for day in self.byday]
+        if self.count is not None:
+            pattern['COUNT'] = self.count
+        if self.until is not None:
+            pattern['UNTIL'] = self.until.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        return pattern
+
+    def to_rrule(self):
+        """
+        The rule as an RFC 5545 RRULE value ("FREQ=WEEKLY;INTERVAL=1;BYDAY=MO").
+        """
+        return ';'.join(
+            f"{name}={','.join(value) if isinstance(value, list) else value}"
+            for name, value in self.to_pattern().items()
+        )
+
+    @classmethod
+    def from_pattern(cls, pattern):
+        """
+        Build a rule from an RRULE string ("FREQ=WEEKLY;BYDAY=MO,WE") or
+        the equivalent JSON object.
+        """
+        if isinstance(pattern, str):
+            parts = {}
+            for part in pattern.removeprefix('RRULE:').split(';'):
+                if '=' in part:
+                    key, value = part.split('=', 1)
+                    parts[key.strip().upper()] = value.strip()
+        elif isinstance(pattern, dict):
+            parts = {str(key).upper(): value for key, value in pattern.items()}
+        else:
+            raise ValueError('Recurrence pattern must be a string or an object')
+
+        unknown = set(parts) - {'FREQ', 'INTERVAL', 'BYDAY', 'COUNT', 'UNTIL'}
+        if unknown:
+            raise ValueError(f"Unsupported rule parts: {', '.join(sorted(unknown))}")
+
+        freq = str(parts.get('FREQ', '')).upper()
+        if freq not in FREQUENCIES:
+            raise ValueError(f'Unsupported FREQ: {freq or None}')
+        interval = _positive_int(parts.get('INTERVAL') or 1, 'INTERVAL')
+
+        byday = parts.get('BYDAY')
+        if byday:
+            if isinstance(byday, str):
+                byday = byday.split(',')
+            if freq not in ('DAILY', 'WEEKLY'):
+                raise ValueError('BYDAY is only supported for DAILY and WEEKLY rules')
+            try:
+                byday = tuple(sorted({WEEKDAYS.index(str(day).strip().upper()) for day in byday}))
+            except ValueError:
+                raise ValueError(f'Invalid BYDAY: {parts["BYDAY"]}')
+        else:
+            byday = None
+
+        count = parts.get('COUNT')
+        count = _positive_int(count, 'COUNT') if count not in (None, '') else None
+        until = parts.get('UNTIL')
+        until = _parse_until(until) if until not in (None, '') else None
+        return cls(freq, interval, byday, count, until)
+
+    def _iter_from(self, dtstart, after):
+        """
+        Yield (index, start) for every occurrence in order, beginning at or
+        shortly before the first occurrence starting after ``after``.
+        ``index`` is the occurrence's position in the whole series.
+        """
+        if self.freq == 'DAILY' and self.byday and self.interval == 1:
+            # A daily rule limited to weekdays is the weekly rule over them
+            yield from self._iter_weekly(dtstart, after, 1, self.byday)
+        elif self.freq == 'DAILY' and self.byday and self.interval % 7 == 0:
+            # Every step lands on the starting weekday
+            if dtstart.weekday() in self.byday:
+                yield from self._iter_daily(dtstart, after)
+        elif self.freq == 'DAILY' and self.byday:
+            yield from self._iter_daily_filtered(dtstart, after)
+        elif self.freq == 'DAILY':
+            yield from self._iter_daily(dtstart, after)
+        elif self.freq == 'WEEKLY':
+            yield from self._iter_weekly(
+                dtstart, after, self.interval, self.byday or (dtstart.weekday(),)
+            )
+        else:
+            months = self.interval * (12 if self.freq == 'YEARLY' else 1)
+            yield from self._iter_monthly(dtstart, after, months)
+
+    def _iter_daily(self, dtstart, after):
+        step = timedelta(days=self.interval)
+        index = max(0, (after - dtstart) // step)
+        while True:
+            yield index, dtstart + index * step
+            index += 1
+
+    def _iter_weekly(self, dtstart, after, interval, days):
+        weekday = dtstart.weekday()
+        anchor = dtstart - timedelta(days=weekday)
+        period_length = timedelta(weeks=interval)
+        first_period = sum(1 for day in days if day >= weekday)
+
+        period = max(0, (after - anchor) // period_length)
+        index = 0 if period == 0 else first_period + (period - 1) * len(days)
+        while True:
+            week_start = anchor + period * period_length
+            for day in days:
+                if period == 0 and day < weekday:
+                    continue
+                yield index, week_start + timedelta(days=day)
+                index += 1
+            period += 1
+
+    def _iter_daily_filtered(self, dtstart, after):
+        # The interval is not a multiple of seven, so every seven steps
+        # visit each weekday once and hold len(byday) occurrences
+        step = timedelta(days=self.interval)
+        cycle = max(0, (after - dtstart) // (7 * step))
+        index = cycle * len(self.byday)
+        current = dtstart + cycle * 7 * step
+        while True:
+            if current.weekday() in self.byday:
+                yield index, current
+                index += 1
+            current += step
+
+    def _iter_monthly(self, dtstart, after, months):
+        if dtstart.day <= 28:
+            # Every period has this day, so the series index is the period number
+            elapsed = (after.year - dtstart.year) * 12 + after.month - dtstart.month
+            period = max(0, elapsed // months - 1)
+            while True:
+                yield period, _add_months(dtstart, period * months)
+                period += 1
+        else:
+            # Months without this day are skipped and not counted
+            elapsed = (after.year - dtstart.year) * 12 + after.month - dtstart.month
+            period = max(0, elapsed // months - 1)
+            index = _periods_with_day(dtstart, months, period)
+            while True:
+                current = _add_months(dtstart, period * months)
+                if current is not None:
+                    yield index, current
+                    index += 1
+                period += 1
+
+    def starts(self, dtstart, start, end):
+        """
+        Yield the start of every occurrence beginning in [start, end).
+        """
+        for index, occurrence in self._iter_from(dtstart, start):
+            if occurrence >= end:
+                return
+            if self.count is not None and index >= self.count:
+                return
+            if self.until is not None and occurrence > self.until:
+                return
+            if occurrence >= start:
+                yield occurrence
+
+    def between(self, dtstart, duration, start, end):
+        """
+        Yield (start, end) for every occurrence overlapping [start, end),
+        where the series begins at ``dtstart`` and each occurrence lasts
+        ``duration``.
+        """
+        for occurrence in self.starts(dtstart, start - duration, end):
+            if occurrence + duration > start:
+                yield occurrence, occurrence + duration
+
+@lru_cache(maxsize=1024)
+def _compile(key):
+    if isinstance(key, tuple):
+        key = {name: list(value) if isinstance(value, tuple) else value for name, value in key}
+    return RecurrenceRule.from_pattern(key)
+
+def compile_rule(pattern):
+    """
+    Return the RecurrenceRule for a stored pattern, parsing each distinct
+    pattern once. Rules are shared between callers and must not be
+    mutated. Raises ValueError for invalid patterns.
+    """
+    if isinstance(pattern, dict):
+        # JSON patterns are cached under a hashable, order-independent key
+        try:
+            pattern = tuple(sorted(
+                (name, tuple(value) if isinstance(value, list) else value)
+                for name, value in pattern.items()
+            ))
+            hash(pattern)
+        except TypeError:
+            raise ValueError('Invalid recurrence pattern')
+    elif not isinstance(pattern, str):
+        raise ValueError('Recurrence pattern must be a string or an object')
+    return _compile(pattern)
+
+def expand_occurrences(rows, start, end):
+    """
+    Turn ``(id, start_time, end_time, is_recurring, recurrence_pattern)``
+    rows into Occurrence tuples overlapping [start, end), sorted by start.
+    Rows with a pattern that cannot be parsed count as single events.
+    """
+    occurrences = []
+    for event_id, event_start, event_end, is_recurring, pattern in rows:
+        rule = None
+        if is_recurring and pattern:
+            try:
+                rule = compile_rule(pattern)
+            except ValueError:
+                rule = None
+        if rule is None:
+            if event_start < end and event_end > start:
+                occurrences.append(Occurrence(event_id, event_start, event_end))
+            continue
+        for occurrence_start, occurrence_end in rule.between(
+            event_start, event_end - event_start, start, end
+        ):
+            occurrences.append(Occurrence(event_id, occurrence_start, occurrence_end))
+    occurrences.sort(key=lambda occurrence: occurrence.start)
+    return occurrences
@@ -0,0 +1,42 @@
+import uuid
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# MessagePack extension type carrying a UUID as its 16 raw bytes
+MSGPACK_UUID = 1
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets requests that accept only ``text/event-stream`` through content
+    negotiation. Streams are written by the view; anything else rendered
+    here, like an error, is sent as JSON.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders ``application/msgpack``. Datetimes travel as the timestamp
+    extension type and UUIDs as MSGPACK_UUID; anything else msgpack has
+    no type for is encoded the way the JSON renderer would.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    @staticmethod
+    def encode(value):
+        if isinstance(value, uuid.UUID):
+            return msgpack.ExtType(MSGPACK_UUID, value.bytes)
+        return JSONEncoder().default(value)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encode, datetime=True)
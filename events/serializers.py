@@ -1,6 +1,13 @@
+from datetime import time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .cache import invalidate_roles
+from .conf import events_setting
 from .models import Event, EventPermission, EventVersion, EventChangeLog, EventConflict
+from .recurrence import compile_rule
+from .versions import StaleVersion, build_version, reconstruct, snapshot
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,12 +26,21 @@ class EventPermissionSerializer(serializers.ModelSerializer):
 
 class EventVersionSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
+    data = serializers.SerializerMethodField()
 
     class Meta:
         model = EventVersion
         fields = ('id', 'version_number', 'data', 'created_by', 'created_at', 'change_reason')
         read_only_fields = ('id', 'version_number', 'created_by', 'created_at')
 
+    def get_data(self, obj):
+        # Only keyframes store a snapshot; pages fill the rest in with materialize()
+        if hasattr(obj, 'snapshot'):
+            return obj.snapshot
+        if obj.data is not None:
+            return obj.data
+        return reconstruct(obj.event_id, obj.version_number)
+
 class EventChangeLogSerializer(serializers.ModelSerializer):
     changed_by = UserSerializer(read_only=True)
     version = EventVersionSerializer(read_only=True)
@@ -58,11 +74,24 @@ class EventSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_by', 'created_at', 'updated_at', 'version')
 
     def get_current_version(self, obj):
-        try:
-            version = obj.versions.latest('version_number')
-            return EventVersionSerializer(version).data
-        except EventVersion.DoesNotExist:
+        # Use the version prefetched by EventViewSet.get_queryset when present
+        if hasattr(obj, 'latest_versions'):
+            version = obj.latest_versions[0] if obj.latest_versions else None
+        else:
+            version = obj.versions.order_by('-version_number').select_related('created_by').first()
+        if version is not None and not hasattr(version, 'snapshot'):
+            # The latest version records the event as it is now
+            version.snapshot = snapshot(obj)
+        return EventVersionSerializer(version).data if version else None
+
+    def validate_recurrence_pattern(self, value):
+        # Parse once at write time and store the canonical form
+        if value in (None, '', {}):
             return None
+        try:
+            return compile_rule(value).to_pattern()
+        except (TypeError, ValueError) as exc:
+            raise serializers.ValidationError(str(exc))
 
     def validate(self, data):
         if data.get('start_time') and data.get('end_time'):
@@ -70,9 +99,131 @@ class EventSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("End time must be after start time")
         return data
 
+def represent_user(user):
+    return {
+        'id': user.pk,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+    }
+
+def represent_events(events):
+    """
+    What EventSerializer(events, many=True).data holds, built straight from
+    instances loaded through EventViewSet.with_related(), without DRF's
+    per-field machinery. Datetimes and UUIDs are left for the renderer,
+    which for JSON produces the same text.
+    """
+    rows = []
+    for event in events:
+        version = event.latest_versions[0] if event.latest_versions else None
+        rows.append({
+            'id': event.id,
+            'title': event.title,
+            'description': event.description,
+            'start_time': event.start_time,
+            'end_time': event.end_time,
+            'location': event.location,
+            'created_by': represent_user(event.created_by),
+            'created_at': event.created_at,
+            'updated_at': event.updated_at,
+            'is_recurring': event.is_recurring,
+            'recurrence_pattern': event.recurrence_pattern,
+            'version': event.version,
+            'permissions': [
+                {
+                    'id': permission.id,
+                    'user': represent_user(permission.user),
+                    'role': permission.role,
+                    'created_at': permission.created_at,
+                    'updated_at': permission.updated_at,
+                }
+                for permission in event.permissions.all()
+            ],
+            'current_version': version and {
+                'id': version.id,
+                'version_number': version.version_number,
+                'data': getattr(version, 'snapshot', None) or snapshot(event),
+                'created_by': represent_user(version.created_by),
+                'created_at': version.created_at,
+                'change_reason': version.change_reason,
+            },
+        })
+    return rows
+
+class PermissionGrantSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    role = serializers.ChoiceField(
+        choices=EventPermission.Role.choices,
+        default=EventPermission.Role.VIEWER
+    )
+
+class FreeBusySerializer(serializers.Serializer):
+    users = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+    def validate_users(self, value):
+        user_ids = set(value)
+        if len(user_ids) > events_setting('FREEBUSY_MAX_USERS'):
+            raise serializers.ValidationError(
+                f"At most {events_setting('FREEBUSY_MAX_USERS')} users per request"
+            )
+        missing = user_ids - set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                [f'Unknown user_id {user_id}' for user_id in sorted(missing)]
+            )
+        return sorted(user_ids)
+
+    def validate(self, data):
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError("End time must be after start time")
+        if data['end'] - data['start'] > timedelta(days=events_setting('RANGE_MAX_DAYS')):
+            raise serializers.ValidationError(
+                f"Window may span at most {events_setting('RANGE_MAX_DAYS')} days"
+            )
+        return data
+
+class SlotSearchSerializer(FreeBusySerializer):
+    duration = serializers.IntegerField(min_value=1, help_text='Minutes')
+    step = serializers.IntegerField(min_value=1, default=15, help_text='Minutes between candidates')
+    count = serializers.IntegerField(min_value=1, default=10)
+    work_start = serializers.TimeField(default=time(9))
+    work_end = serializers.TimeField(default=time(17))
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        default=[0, 1, 2, 3, 4],
+        help_text='Monday is 0'
+    )
+    timezone = serializers.CharField(default='UTC')
+
+    def validate_count(self, value):
+        if value > events_setting('SLOT_MAX_RESULTS'):
+            raise serializers.ValidationError(
+                f"At most {events_setting('SLOT_MAX_RESULTS')} slots per request"
+            )
+        return value
+
+    def validate_timezone(self, value):
+        try:
+            return ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError(f'Unknown time zone {value}')
+
+    def validate(self, data):
+        data = super().validate(data)
+        if data['work_start'] >= data['work_end']:
+            raise serializers.ValidationError("Working hours must end after they start")
+        data['duration'] = timedelta(minutes=data['duration'])
+        data['step'] = timedelta(minutes=data['step'])
+        data['weekdays'] = set(data['weekdays'])
+        return data
+
 class EventCreateSerializer(EventSerializer):
     permissions = serializers.ListField(
-        child=serializers.DictField(),
+        child=PermissionGrantSerializer(),
         write_only=True,
         required=False
     )
@@ -80,6 +231,17 @@ class EventCreateSerializer(EventSerializer):
     class Meta(EventSerializer.Meta):
         fields = EventSerializer.Meta.fields + ('permissions',)
 
+    def validate_permissions(self, value):
+        # batch_create checks the users of every item at once in bulk_create_events
+        if self.parent is None:
+            user_ids = {grant['user_id'] for grant in value}
+            missing = user_ids - set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+            if missing:
+                raise serializers.ValidationError(
+                    [f'Unknown user_id {user_id}' for user_id in sorted(missing)]
+                )
+        return value
+
     def create(self, validated_data):
         permissions_data = validated_data.pop('permissions', [])
         event = super().create(validated_data)
@@ -91,13 +253,25 @@ class EventCreateSerializer(EventSerializer):
             role=EventPermission.Role.OWNER
         )
 
-        # Create additional permissions
+        # Create additional permissions; the creator always stays owner
+        granted = {self.context['request'].user.pk}
         for perm_data in permissions_data:
+            if perm_data['user_id'] in granted:
+                continue
+            granted.add(perm_data['user_id'])
             EventPermission.objects.create(
                 event=event,
                 user_id=perm_data['user_id'],
                 role=perm_data.get('role', EventPermission.Role.VIEWER)
             )
+
+        # Record the initial version so changelog entries have one to point at
+        version = build_version(
+            event, None, snapshot(event), self.context['request'].user, 'Initial version'
+        )
+        version.save()
+        event.latest_versions = [version]
+        invalidate_roles((user_id, event.pk) for user_id in granted)
         return event
 
 class EventUpdateSerializer(EventSerializer):
@@ -105,18 +279,34 @@ class EventUpdateSerializer(EventSerializer):
         fields = EventSerializer.Meta.fields
 
     def update(self, instance, validated_data):
-        # Create a new version before updating
-        EventVersion.objects.create(
-            event=instance,
-            version_number=instance.version + 1,
-            data=self.to_representation(instance),
-            created_by=self.context['request'].user,
-            change_reason=validated_data.get('change_reason', '')
+        """
+        Compare-and-swap on ``version``: a single UPDATE that only applies
+        to the version the edit was made against (``expected_version``,
+        defaulting to the one loaded), so no row lock is held and
+        concurrent editors cannot overwrite each other.
+        """
+        expected = validated_data.pop('expected_version', instance.version)
+        if expected != instance.version:
+            raise StaleVersion(f'Event is at version {instance.version}')
+        previous = snapshot(instance)
+
+        now = timezone.now()
+        updated = Event.objects.filter(pk=instance.pk, version=expected).update(
+            **validated_data, version=expected + 1, updated_at=now
         )
+        if not updated:
+            raise StaleVersion('Event was modified concurrently')
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.version = expected + 1
+        instance.updated_at = now
 
-        # Update the event
-        instance = super().update(instance, validated_data)
-        instance.version += 1
-        instance.save()
+        # Record the new version as a delta from the previous one
+        version = build_version(
+            instance, previous, snapshot(instance),
+            self.context['request'].user, validated_data.get('change_reason', '')
+        )
+        version.save()
+        instance.latest_versions = [version]
 
         return instance 
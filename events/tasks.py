@@ -0,0 +1,68 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.db import connection, transaction
+from .conf import events_setting
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=events_setting('TASK_WORKERS'),
+                thread_name_prefix='events-tasks'
+            )
+        return _executor
+
+def run_with_retry(func, *args, worker=False):
+    """
+    Run a job, retrying with exponential backoff on failure.
+    On pool threads each attempt gets a fresh database connection.
+    """
+    retries = events_setting('TASK_MAX_RETRIES')
+    delay = events_setting('TASK_RETRY_DELAY')
+    for attempt in range(retries + 1):
+        try:
+            return func(*args)
+        except Exception:
+            if attempt == retries:
+                logger.exception('Job %s failed after %d attempts', func.__name__, attempt + 1)
+                raise
+            logger.warning('Job %s failed, retrying', func.__name__, exc_info=True)
+            time.sleep(delay * 2 ** attempt)
+        finally:
+            if worker:
+                connection.close()
+
+def runs_inline():
+    """
+    Whether jobs run inline: ``EVENTS['TASKS_EAGER']``, or on SQLite when
+    it is None.
+    """
+    eager = events_setting('TASKS_EAGER')
+    if eager is None:
+        return connection.vendor == 'sqlite'
+    return eager
+
+def enqueue(func, *args):
+    """
+    Hand a job to the local worker pool, or run it inline (see
+    runs_inline()).
+    """
+    if runs_inline():
+        return run_with_retry(func, *args)
+    return get_executor().submit(partial(run_with_retry, func, *args, worker=True))
+
+def enqueue_on_commit(func, *args):
+    """
+    Enqueue a job once the current transaction commits, so the worker
+    only ever sees committed rows.
+    """
+    transaction.on_commit(lambda: enqueue(func, *args))
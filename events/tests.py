@@ -1,2 +1,1205 @@
-from django.test import TestCase
+import json
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from random import Random
+from unittest import mock
+import msgpack
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .audit import drain
+from .cache import get_role_cache, response_cache
+from .conflicts import IntervalIndex, conflict_pair, schedule_conflict_detection
+from .models import (
+    ChangeLogOutbox, Event, EventArchive, EventChangeLog, EventConflict, EventOccurrence,
+    EventPermission, EventVersion
+)
+from .occurrences import sync_occurrences
+from .parsers import MessagePackParser
+from .recurrence import RecurrenceRule, compile_rule
+from .serializers import EventSerializer, represent_events
+from .tasks import enqueue
+from .views import EventViewSet
 
+class EventListQueryCountTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.viewers = [
+            User.objects.create_user(f'viewer{i}', password='password') for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def create_events(self, count):
+        start = timezone.now()
+        for i in range(count):
+            event = Event.objects.create(
+                title=f'Event {i}',
+                start_time=start + timedelta(hours=i),
+                end_time=start + timedelta(hours=i, minutes=30),
+                created_by=self.owner
+            )
+            EventPermission.objects.create(
+                event=event, user=self.owner, role=EventPermission.Role.OWNER
+            )
+            for viewer in self.viewers:
+                EventPermission.objects.create(event=event, user=viewer)
+            for number in (1, 2):
+                EventVersion.objects.create(
+                    event=event, version_number=number, data={}, created_by=self.owner
+                )
+
+    def count_list_queries(self):
+        # Rows are written straight through the ORM, which never moves the collection token
+        response_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_query_count_is_constant(self):
+        self.create_events(1)
+        baseline = self.count_list_queries()
+        self.create_events(24)
+        self.assertEqual(self.count_list_queries(), baseline)
+
+    def test_list_returns_latest_version(self):
+        self.create_events(2)
+        response = self.client.get('/api/events/')
+        for item in response.data['results']:
+            self.assertEqual(item['current_version']['version_number'], 2)
+            self.assertEqual(len(item['permissions']), 4)
+
+class EventPaginationTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        for i in range(25):
+            event = Event.objects.create(
+                title=f'Event {i}',
+                # Pairs of events share a start time to exercise the id tie-break
+                start_time=start + timedelta(hours=i // 2),
+                end_time=start + timedelta(hours=i // 2, minutes=30),
+                created_by=self.owner
+            )
+            EventPermission.objects.create(
+                event=event, user=self.owner, role=EventPermission.Role.OWNER
+            )
+
+    def test_cursor_walks_every_event_once_in_order(self):
+        seen = []
+        url = '/api/events/?page_size=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), 7)
+            seen.extend(item['id'] for item in page['results'])
+            url = page['next']
+
+        expected = Event.objects.order_by('-start_time', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(event_id) for event_id in expected])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/events/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+@override_settings(EVENTS={'TASKS_EAGER': True, 'IMPORT_CHUNK_SIZE': 2})
+class EventImportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def post_import(self, body, content_type):
+        response = self.client.post('/api/events/import/', body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_ndjson_reports_bad_rows_and_imports_the_rest(self):
+        lines = [
+            {'title': 'A', 'start_time': '2030-01-01T09:00:00Z', 'end_time': '2030-01-01T10:00:00Z'},
+            {'title': 'B', 'start_time': '2030-01-01T11:00:00Z', 'end_time': '2030-01-01T10:00:00Z'},
+            {'title': 'C', 'start_time': '2030-01-02T09:00:00Z', 'end_time': '2030-01-02T10:00:00Z',
+             'permissions': [{'user_id': 999}]},
+            {'title': 'D', 'start_time': '2030-01-03T09:00:00Z', 'end_time': '2030-01-03T10:00:00Z'},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n{not json\n'
+        reports = self.post_import(body, 'application/x-ndjson')
+
+        self.assertEqual([report['row'] for report in reports[:-1]], [2, 3, 5])
+        self.assertEqual(reports[-1], {'created': 2, 'failed': 3})
+        self.assertEqual(
+            sorted(Event.objects.filter(permissions__user=self.owner).values_list('title', flat=True)),
+            ['A', 'D']
+        )
+
+    def test_csv(self):
+        start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        body = (
+            'title,start_time,end_time,is_recurring,recurrence_pattern\n'
+            f'Standup,{start.isoformat()},{(start + timedelta(minutes=15)).isoformat()},'
+            'true,FREQ=DAILY;COUNT=3\n'
+            f'Lunch,{start.isoformat()},{(start + timedelta(hours=1)).isoformat()},,\n'
+        )
+        reports = self.post_import(body, 'text/csv')
+
+        self.assertEqual(reports, [{'created': 2, 'failed': 0}])
+        standup = Event.objects.get(title='Standup')
+        self.assertEqual(standup.recurrence_pattern, {'FREQ': 'DAILY', 'INTERVAL': 1, 'COUNT': 3})
+        self.assertEqual(standup.occurrences.count(), 3)
+
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.viewer = User.objects.create_user('viewer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        self.event = Event.objects.create(
+            title='Event', start_time=start, end_time=start + timedelta(hours=1),
+            created_by=self.owner
+        )
+        EventPermission.objects.create(
+            event=self.event, user=self.owner, role=EventPermission.Role.OWNER
+        )
+        EventVersion.objects.create(
+            event=self.event, version_number=1, data={}, created_by=self.owner
+        )
+
+    def test_share_invalidates_cached_role(self):
+        cache = get_role_cache()
+        self.assertEqual(cache.get(self.owner.pk, self.event.pk), EventPermission.Role.OWNER)
+        hits = cache.hits
+        self.assertEqual(cache.get(self.owner.pk, self.event.pk), EventPermission.Role.OWNER)
+        self.assertEqual(cache.hits, hits + 1)
+        self.assertIsNone(cache.get(self.viewer.pk, self.event.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/events/{self.event.pk}/share/', [{'user_id': self.viewer.pk}], format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(cache.get(self.viewer.pk, self.event.pk), EventPermission.Role.VIEWER)
+
+    def test_no_role_is_not_kept_in_process(self):
+        cache = get_role_cache()
+        self.assertIsNone(cache.get(self.viewer.pk, self.event.pk))
+        # As if shared through another process, whose invalidation never reaches this one
+        EventPermission.objects.create(event=self.event, user=self.viewer)
+        self.assertEqual(cache.get(self.viewer.pk, self.event.pk), EventPermission.Role.VIEWER)
+
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        response = self.client.post('/api/events/', {
+            'title': 'Event',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+        }, format='json')
+        self.url = f"/api/events/{response.data['id']}/"
+
+    def test_detail_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertLessEqual(len(queries), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Renamed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_moves_on_write(self):
+        etag = self.client.get('/api/events/')['ETag']
+        self.assertEqual(self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+        response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['title'], 'Renamed')
+
+    def test_list_etag_moves_for_every_holder(self):
+        viewer = User.objects.create_user('viewer', password='password')
+        self.client.post(self.url + 'share/', [{'user_id': viewer.pk}], format='json')
+        client = APIClient()
+        client.force_authenticate(viewer)
+        etag = client.get('/api/events/')['ETag']
+        # Only the viewer's collection token is read, however many events they see
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get('/api/events/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+        self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+        response = client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['title'], 'Renamed')
+
+    def test_list_etag_follows_the_media_type(self):
+        etag = self.client.get('/api/events/')['ETag']
+        response = self.client.get(
+            '/api/events/', HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Accept', response['Vary'])
+
+@override_settings(EVENTS={'TASKS_EAGER': True, 'VERSION_KEYFRAME_INTERVAL': 3})
+class VersionTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        response = self.client.post('/api/events/', {
+            'title': 'Title 1',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+        }, format='json')
+        self.url = f"/api/events/{response.data['id']}/"
+        for number in range(2, 9):
+            self.client.patch(self.url, {'title': f'Title {number}'}, format='json')
+
+    def test_history_rebuilds_every_version(self):
+        response = self.client.get(self.url + 'history/?page_size=10')
+        self.assertEqual(
+            [(item['version_number'], item['data']['title']) for item in response.data['results']],
+            [(number, f'Title {number}') for number in range(8, 0, -1)]
+        )
+        self.assertEqual(
+            list(EventVersion.objects.filter(data__isnull=False).order_by('version_number')
+                 .values_list('version_number', flat=True)),
+            [1, 4, 7]
+        )
+
+    def test_diff_and_rollback(self):
+        response = self.client.get(self.url + 'diff/?version1=2&version2=6')
+        self.assertEqual(response.data['modified'], {'title': {'old': 'Title 2', 'new': 'Title 6'}})
+
+        response = self.client.post(self.url + 'rollback/', {'version_id': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Title 5')
+        self.assertEqual(response.data['version'], 9)
+        self.assertEqual(response.data['current_version']['data']['title'], 'Title 5')
+
+class AuditOutboxTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        response = self.client.post('/api/events/', {
+            'title': 'Title',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+        }, format='json')
+        self.url = f"/api/events/{response.data['id']}/"
+        self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+
+    def test_changelog_drains_pending_entries(self):
+        # TestCase never commits, so nothing has been drained yet
+        self.assertEqual(ChangeLogOutbox.objects.count(), 2)
+        self.assertFalse(EventChangeLog.objects.exists())
+
+        response = self.client.get(self.url + 'changelog/')
+        self.assertEqual(
+            [(item['change_type'], item['version']['version_number']) for item in response.data['results']],
+            [('UPDATE', 2), ('CREATE', 1)]
+        )
+        self.assertFalse(ChangeLogOutbox.objects.exists())
+
+@override_settings(EVENTS={'AUDIT_FLUSH_INTERVAL': 0.2})
+class AuditFlushIntervalTests(TransactionTestCase):
+    def test_idle_outbox_drains_within_the_interval(self):
+        owner = User.objects.create_user('owner', password='password')
+        client = APIClient()
+        client.force_authenticate(owner)
+        start = timezone.now()
+        url = '/api/events/{}/'.format(client.post('/api/events/', {
+            'title': 'Title',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+        }, format='json').data['id'])
+        client.patch(url, {'title': 'Renamed'}, format='json')
+        client.patch(url, {'title': 'Renamed again'}, format='json')
+
+        # Nothing else is written, so only the timer can drain the last edits.
+        # Wait for it rather than polling: SQLite's in-memory test database
+        # locks whole tables, so reads next to the drain would fail
+        for thread in threading.enumerate():
+            if isinstance(thread, threading.Timer):
+                thread.join(5)
+        self.assertFalse(ChangeLogOutbox.objects.exists())
+        self.assertEqual(EventChangeLog.objects.count(), 3)
+
+@override_settings(EVENTS={'TASKS_EAGER': True, 'VERSION_KEYFRAME_INTERVAL': 3})
+class ArchiveTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        response = self.client.post('/api/events/', {
+            'title': 'Title 1',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+        }, format='json')
+        self.url = f"/api/events/{response.data['id']}/"
+        for number in range(2, 9):
+            self.client.patch(self.url, {'title': f'Title {number}'}, format='json')
+        # Versions 1 to 5 and their changelog entries are from last year
+        drain()
+        old = timezone.now() - timedelta(days=365)
+        EventVersion.objects.filter(version_number__lte=5).update(created_at=old)
+        EventChangeLog.objects.filter(version__version_number__lte=5).update(changed_at=old)
+        call_command('archive_history', days=30, stdout=StringIO())
+
+    def test_archive_moves_old_rows(self):
+        self.assertEqual(
+            list(EventVersion.objects.order_by('version_number').values_list('version_number', flat=True)),
+            [6, 7, 8]
+        )
+        # The oldest hot version becomes a keyframe
+        self.assertIsNotNone(EventVersion.objects.get(version_number=6).data)
+        self.assertEqual(EventChangeLog.objects.count(), 3)
+        self.assertEqual(
+            sorted(EventArchive.objects.values_list('kind', 'row_count')),
+            [('changelog', 5), ('versions', 5)]
+        )
+
+    def test_reads_fall_back_to_archive(self):
+        response = self.client.get(self.url + 'history/?page_size=3')
+        titles = [item['data']['title'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            titles += [item['data']['title'] for item in response.data['results']]
+        self.assertEqual(titles, [f'Title {number}' for number in range(8, 0, -1)])
+
+        response = self.client.get(self.url + 'changelog/?page_size=100')
+        self.assertEqual(
+            [item['version']['version_number'] for item in response.data['results']],
+            list(range(8, 0, -1))
+        )
+        self.assertEqual(response.data['results'][-1]['changed_by']['username'], 'owner')
+
+        response = self.client.get(self.url + 'changelog/export/')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['version__version_number'] for row in rows], list(range(8, 0, -1)))
+
+        response = self.client.get(self.url + 'diff/?version1=2&version2=7')
+        self.assertEqual(response.data['modified'], {'title': {'old': 'Title 2', 'new': 'Title 7'}})
+
+        response = self.client.post(self.url + 'rollback/', {'version_id': 3}, format='json')
+        self.assertEqual(response.data['title'], 'Title 3')
+
+def edit_until_applied(client, url, title):
+    """
+    Read-modify-write with If-Match, retrying on 412. Returns the attempts.
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        version = client.get(url).data['version']
+        response = client.patch(url, {'title': title}, format='json', HTTP_IF_MATCH=f'"{version}"')
+        if response.status_code != 412:
+            assert response.status_code == 200, response.status_code
+            return attempts
+
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class OptimisticConcurrencyTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        response = self.client.post('/api/events/', {
+            'title': 'Title',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+        }, format='json')
+        self.url = f"/api/events/{response.data['id']}/"
+
+    def test_if_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(self.url, {'title': 'A'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 2)
+
+        # Both the stale ETag and the stale version number are refused
+        for stale in (etag, '"1"'):
+            response = self.client.patch(self.url, {'title': 'B'}, format='json', HTTP_IF_MATCH=stale)
+            self.assertEqual(response.status_code, 412)
+        response = self.client.post(
+            self.url + 'rollback/', {'version_id': 1}, format='json', HTTP_IF_MATCH='"1"'
+        )
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Event.objects.get().title, 'A')
+        self.assertEqual(EventVersion.objects.count(), 2)
+
+    def test_delete(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.patch(self.url, {'title': 'A'}, format='json')
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH=etag).status_code, 412)
+
+        # An edit landing between the load and the delete is not overwritten
+        get_object = EventViewSet.get_object
+        def edited_meanwhile(view):
+            event = get_object(view)
+            Event.objects.filter(pk=event.pk).update(title='B', version=F('version') + 1)
+            return event
+        with mock.patch.object(EventViewSet, 'get_object', edited_meanwhile):
+            self.assertEqual(self.client.delete(self.url).status_code, 409)
+        event = Event.objects.get()
+        self.assertEqual((event.title, event.version, event.is_deleted), ('B', 3, False))
+
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH='"3"').status_code, 204)
+        self.assertEqual(Event.objects.filter(is_deleted=True).values_list('title', flat=True).get(), 'B')
+
+    def test_interleaved_editors(self):
+        # Every editor reads the same version, then all of them write
+        editors = 5
+        versions = [self.client.get(self.url).data['version'] for _ in range(editors)]
+        statuses = [
+            self.client.patch(
+                self.url, {'title': f'Editor {editor}'}, format='json',
+                HTTP_IF_MATCH=f'"{version}"'
+            ).status_code
+            for editor, version in enumerate(versions)
+        ]
+        self.assertEqual(statuses, [200] + [412] * (editors - 1))
+        self.assertEqual(self.client.get(self.url).data['title'], 'Editor 0')
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers')
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class ConcurrentEditorStressTests(TransactionTestCase):
+    editors = 8
+    edits = 10
+
+    def test_no_lost_updates(self):
+        owner = User.objects.create_user('owner', password='password')
+        client = APIClient()
+        client.force_authenticate(owner)
+        start = timezone.now()
+        url = '/api/events/{}/'.format(client.post('/api/events/', {
+            'title': 'Title',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+        }, format='json').data['id'])
+
+        errors = []
+
+        def editor(number):
+            editor_client = APIClient()
+            editor_client.force_authenticate(owner)
+            try:
+                for edit in range(self.edits):
+                    edit_until_applied(editor_client, url, f'Editor {number} edit {edit}')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=editor, args=(number,)) for number in range(self.editors)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = 1 + self.editors * self.edits
+        self.assertEqual(Event.objects.get().version, total)
+        self.assertEqual(
+            list(EventVersion.objects.order_by('version_number').values_list('version_number', flat=True)),
+            list(range(1, total + 1))
+        )
+
+@override_settings(EVENTS={'TASKS_EAGER': True, 'FEED_HEARTBEAT': 0.1})
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.viewer = User.objects.create_user('viewer', password='password')
+        self.outsider = User.objects.create_user('outsider', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        response = self.client.post('/api/events/', {
+            'title': 'Title',
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=1)).isoformat(),
+            'permissions': [{'user_id': self.viewer.pk}],
+        }, format='json')
+        self.url = f"/api/events/{response.data['id']}/"
+        drain()
+
+    def open_feed(self, user, cursor):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/api/events/feed/?cursor={cursor}', HTTP_ACCEPT='text/event-stream')
+        self.addCleanup(response.close)
+        return (chunk.decode() for chunk in response.streaming_content)
+
+    def test_replay_then_live(self):
+        viewer = self.open_feed(self.viewer, 0)
+        outsider = self.open_feed(self.outsider, 0)
+        self.assertEqual(json.loads(next(viewer).split('data: ', 1)[1])['change_type'], 'CREATE')
+        self.assertEqual(next(outsider), ': keepalive\n\n')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+        frame = next(viewer)
+        self.assertTrue(frame.startswith('id: '))
+        self.assertEqual(json.loads(frame.split('data: ', 1)[1])['version'], 2)
+        self.assertEqual(next(outsider), ': keepalive\n\n')
+
+        # A reconnect after the last entry seen replays nothing
+        cursor = frame.split('\n', 1)[0][4:]
+        self.assertEqual(next(self.open_feed(self.viewer, cursor)), ': keepalive\n\n')
+
+    def test_batch_create_is_pushed(self):
+        viewer = self.open_feed(self.viewer, EventChangeLog.objects.latest('pk').pk)
+        self.assertEqual(next(viewer), ': keepalive\n\n')
+        start = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/events/batch_create/', [{
+                'title': 'Batch',
+                'start_time': start.isoformat(),
+                'end_time': (start + timedelta(hours=1)).isoformat(),
+                'permissions': [{'user_id': self.viewer.pk}],
+            }], format='json')
+        entry = json.loads(next(viewer).split('data: ', 1)[1])
+        self.assertEqual((entry['change_type'], entry['metadata']['batch']), ('CREATE', True))
+
+@override_settings(EVENTS={'TASKS_EAGER': True, 'SYNC_SETTLE_SECONDS': 0})
+class SyncTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.viewer = User.objects.create_user('viewer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = timezone.now()
+        self.ids = [
+            self.client.post('/api/events/', {
+                'title': f'Event {number}',
+                'start_time': (start + timedelta(days=number)).isoformat(),
+                'end_time': (start + timedelta(days=number, hours=1)).isoformat(),
+            }, format='json').data['id']
+            for number in range(3)
+        ]
+
+    def sync(self, **params):
+        return self.client.get('/api/events/sync/', params).data
+
+    def test_changes_since_cursor(self):
+        data = self.sync()
+        self.assertEqual([event['id'] for event in data['events']], self.ids)
+        self.assertEqual(data['deleted'], [])
+        self.assertFalse(data['has_more'])
+        cursor = data['cursor']
+
+        self.client.patch(f'/api/events/{self.ids[2]}/', {'title': 'Renamed'}, format='json')
+        self.client.delete(f'/api/events/{self.ids[0]}/')
+        self.client.post(f'/api/events/{self.ids[1]}/share/', [
+            {'user_id': self.viewer.pk, 'role': 'VIEWER'}
+        ], format='json')
+
+        data = self.sync(since=cursor, page_size=1)
+        self.assertEqual([event['title'] for event in data['events']], ['Renamed'])
+        self.assertTrue(data['has_more'])
+        data = self.sync(since=data['cursor'])
+        self.assertEqual(data['deleted'], [Event.objects.get(pk=self.ids[0]).pk])
+        self.assertEqual([event['id'] for event in data['events']], [self.ids[1]])
+        self.assertFalse(data['has_more'])
+
+        # Nothing has changed since
+        self.assertEqual(self.sync(since=data['cursor']), {
+            'events': [], 'deleted': [], 'cursor': data['cursor'], 'has_more': False
+        })
+
+class FreeBusyTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.viewer = User.objects.create_user('viewer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.day = (timezone.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def create(self, title, start_hour, end_hour):
+        return self.client.post('/api/events/', {
+            'title': title,
+            'start_time': (self.day + timedelta(hours=start_hour)).isoformat(),
+            'end_time': (self.day + timedelta(hours=end_hour)).isoformat(),
+        }, format='json').data['id']
+
+    def test_merged_busy_and_common_free(self):
+        shared = self.create('Standup', 10, 11)
+        self.client.post(f'/api/events/{shared}/share/', [
+            {'user_id': self.viewer.pk, 'role': 'VIEWER'}
+        ], format='json')
+        pending = self.create('Review', 10.5, 12)
+        # Not materialized yet, so it is expanded on the fly
+        EventOccurrence.objects.filter(event_id=pending).delete()
+        Event.objects.filter(pk=pending).update(occurrences_until=None)
+        self.client.delete(f"/api/events/{self.create('Cancelled', 14, 15)}/")
+
+        response = self.client.post('/api/events/freebusy/', {
+            'users': [self.viewer.pk, self.owner.pk],
+            'start': (self.day + timedelta(hours=8)).isoformat(),
+            'end': (self.day + timedelta(hours=18)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        hours = lambda intervals: [
+            [(interval['start'] - self.day) / timedelta(hours=1),
+             (interval['end'] - self.day) / timedelta(hours=1)]
+            for interval in intervals
+        ]
+        self.assertEqual(hours(response.data['busy'][self.owner.pk]), [[10, 12]])
+        self.assertEqual(hours(response.data['busy'][self.viewer.pk]), [[10, 11]])
+        self.assertEqual(hours(response.data['free']), [[8, 10], [12, 18]])
+
+    def test_rejects_unknown_users(self):
+        response = self.client.post('/api/events/freebusy/', {
+            'users': [self.owner.pk, 0],
+            'start': self.day.isoformat(),
+            'end': (self.day + timedelta(days=1)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('users', response.data)
+
+class SlotSearchTests(TestCase):
+    def test_earliest_common_free_slots(self):
+        owner = User.objects.create_user('owner', password='password')
+        viewer = User.objects.create_user('viewer', password='password')
+        client = APIClient()
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        monday = today + timedelta(days=7 - today.weekday())
+        for user, start_hour, end_hour in ((owner, 9, 10), (viewer, 10.5, 11)):
+            client.force_authenticate(user)
+            client.post('/api/events/', {
+                'title': 'Busy',
+                'start_time': (monday + timedelta(hours=start_hour)).isoformat(),
+                'end_time': (monday + timedelta(hours=end_hour)).isoformat(),
+            }, format='json')
+
+        response = client.post('/api/events/slots/', {
+            'users': [owner.pk, viewer.pk],
+            # Starts on Sunday, outside the working week
+            'start': (monday - timedelta(days=1)).isoformat(),
+            'end': (monday + timedelta(days=2)).isoformat(),
+            'duration': 30,
+            'step': 30,
+            'count': 4,
+            'work_start': '09:00',
+            'work_end': '12:00',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(slot['start'] - monday) / timedelta(hours=1) for slot in response.data['slots']],
+            [10, 11, 11.5, 24 + 9]
+        )
+
+class RebuildConflictsTests(TestCase):
+    def test_rebuild_adds_missing_and_removes_stale(self):
+        owner = User.objects.create_user('owner', password='password')
+        other = User.objects.create_user('other', password='password')
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+        def event(user, start_hour, end_hour):
+            event = Event.objects.create(
+                title='Event', created_by=user,
+                start_time=day + timedelta(hours=start_hour),
+                end_time=day + timedelta(hours=end_hour)
+            )
+            EventPermission.objects.create(event=event, user=user, role=EventPermission.Role.OWNER)
+            sync_occurrences([event])
+            return event
+
+        first, second = event(owner, 9, 10), event(owner, 9.5, 10.5)
+        event(other, 9, 10)
+        apart, moved = event(owner, 12, 13), event(owner, 14, 15)
+        deleted = event(owner, 9, 10)
+        Event.objects.filter(pk=deleted.pk).update(is_deleted=True)
+        EventOccurrence.objects.filter(event=deleted).delete()
+        # Stored the other way round, and already dealt with
+        EventConflict.objects.create(
+            event=second, conflicting_event=first,
+            resolution_status=EventConflict.ResolutionStatus.IGNORED
+        )
+        EventConflict.objects.create(event=apart, conflicting_event=moved)
+        EventConflict.objects.create(event=first, conflicting_event=deleted)
+
+        call_command('rebuild_conflicts', workers=1, stdout=StringIO())
+        self.assertEqual(
+            list(EventConflict.objects.values_list('event', 'conflicting_event', 'resolution_status')),
+            [(second.pk, first.pk, EventConflict.ResolutionStatus.IGNORED)]
+        )
+
+        EventConflict.objects.all().delete()
+        call_command('rebuild_conflicts', workers=1, stdout=StringIO())
+        self.assertEqual(
+            list(EventConflict.objects.values_list('event', 'conflicting_event')),
+            [conflict_pair(first.pk, second.pk)]
+        )
+
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class ConflictMaintenanceTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def create(self, start_hour):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/events/', {
+                'title': 'Event',
+                'start_time': (self.day + timedelta(hours=start_hour)).isoformat(),
+                'end_time': (self.day + timedelta(hours=start_hour + 1)).isoformat(),
+            }, format='json').data['id']
+
+    def conflicts(self, **params):
+        response = self.client.get('/api/events/conflicts/', params)
+        self.assertEqual(response.status_code, 200)
+        return {frozenset((str(row['event']), str(row['conflicting_event']))) for row in response.data['results']}
+
+    def test_moves_and_deletes_update_conflicts(self):
+        first, second, third = self.create(9), self.create(9.5), self.create(12)
+        self.assertEqual(self.conflicts(), {frozenset((first, second))})
+
+        # Moving the second event away from the first and onto the third
+        self.client.patch(f'/api/events/{second}/', {
+            'start_time': (self.day + timedelta(hours=12.5)).isoformat(),
+            'end_time': (self.day + timedelta(hours=13.5)).isoformat(),
+        }, format='json')
+        self.assertEqual(self.conflicts(), {frozenset((second, third))})
+        self.assertEqual(self.conflicts(event=first), set())
+
+        self.client.delete(f'/api/events/{third}/')
+        self.assertEqual(self.conflicts(), set())
+        self.assertEqual(EventConflict.objects.count(), 0)
+        self.assertEqual(self.client.get('/api/events/conflicts/', {'status': 'OPEN'}).status_code, 400)
+
+class MessagePackTests(TestCase):
+    def setUp(self):
+        response_cache().clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+    def test_round_trip(self):
+        body = msgpack.packb({
+            'title': 'Packed',
+            'start_time': self.start,
+            'end_time': self.start + timedelta(hours=1),
+        }, datetime=True)
+        response = self.client.post(
+            '/api/events/', body, content_type='application/msgpack', HTTP_ACCEPT='application/msgpack'
+        )
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/api/events/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        page = msgpack.unpackb(response.content, timestamp=3, ext_hook=MessagePackParser.decode)
+        event = page['results'][0]
+        self.assertEqual(event['start_time'], self.start)
+        self.assertEqual(event['id'], Event.objects.get(title='Packed').pk)
+
+        response = self.client.post('/api/events/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_matches_serializer(self):
+        response = self.client.post('/api/events/', {
+            'title': 'Shared',
+            'start_time': self.start.isoformat(),
+            'end_time': (self.start + timedelta(hours=1)).isoformat(),
+            'is_recurring': True,
+            'recurrence_pattern': 'FREQ=WEEKLY;COUNT=4',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        events = EventViewSet().with_related(Event.objects.all())
+        self.assertEqual(
+            JSONRenderer().render(represent_events(events)),
+            JSONRenderer().render(EventSerializer(events, many=True).data)
+        )
+
+class IntervalIndexTests(SimpleTestCase):
+    def test_overlapping_matches_a_linear_scan(self):
+        random = Random(7)
+        intervals = []
+        for key in range(300):
+            start = random.randrange(1000)
+            intervals.append((start, start + random.randrange(1, 60), key))
+        index = IntervalIndex(intervals)
+        self.assertEqual(len(index), 300)
+        for _ in range(200):
+            start = random.randrange(-50, 1050)
+            end = start + random.randrange(1, 80)
+            self.assertEqual(
+                sorted(index.overlapping(start, end)),
+                sorted(key for low, high, key in intervals if low < end and high > start)
+            )
+        # Touching intervals do not overlap
+        self.assertEqual(list(IntervalIndex([(0, 10, 'a')]).overlapping(10, 20)), [])
+        self.assertEqual(list(IntervalIndex([]).overlapping(0, 10)), [])
+
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class ParticipantConflictTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.other = User.objects.create_user('other', password='password')
+        self.client = APIClient()
+        self.day = (timezone.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def create(self, user, start_hour, **fields):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/events/', {
+                'title': 'Event',
+                'start_time': (self.day + timedelta(hours=start_hour)).isoformat(),
+                'end_time': (self.day + timedelta(hours=start_hour + 1)).isoformat(),
+                **fields
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return str(response.data['id'])
+
+    def test_only_shared_participants_conflict(self):
+        mine = self.create(self.owner, 9)
+        theirs = self.create(self.other, 9)
+        self.assertFalse(EventConflict.objects.exists())
+
+        shared = self.create(self.other, 9.5, permissions=[{'user_id': self.owner.pk}])
+        conflicts = EventConflict.objects.values_list('event', 'conflicting_event')
+        self.assertEqual(
+            {(str(event), str(other)) for event, other in conflicts},
+            {conflict_pair(mine, shared), conflict_pair(theirs, shared)}
+        )
+
+class TaskQueueTests(SimpleTestCase):
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_sqlite_runs_jobs_inline_by_default(self):
+        with mock.patch('events.tasks.get_executor') as get_executor:
+            self.assertEqual(enqueue(sum, [1, 2]), 3)
+        get_executor.assert_not_called()
+
+    @override_settings(EVENTS={'TASKS_EAGER': False})
+    def test_pool_runs_jobs_when_not_eager(self):
+        with mock.patch('events.tasks.get_executor') as get_executor:
+            enqueue(sum, [1, 2])
+        get_executor.return_value.submit.assert_called_once()
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+class RecurrenceTests(SimpleTestCase):
+    # (pattern, series start, window start, window end, expected starts)
+    CASES = [
+        ('FREQ=DAILY;COUNT=3', utc(2024, 1, 1, 9), utc(2024, 1, 1), utc(2024, 2, 1),
+         [utc(2024, 1, 1, 9), utc(2024, 1, 2, 9), utc(2024, 1, 3, 9)]),
+        ('FREQ=DAILY;UNTIL=20240105T090000Z', utc(2024, 1, 1, 9), utc(2024, 1, 3), utc(2024, 2, 1),
+         [utc(2024, 1, 3, 9), utc(2024, 1, 4, 9), utc(2024, 1, 5, 9)]),
+        # Starting mid-week skips the earlier BYDAY days of the first week
+        ('FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=5', utc(2024, 1, 3, 9), utc(2024, 1, 9), utc(2024, 2, 1),
+         [utc(2024, 1, 10, 9), utc(2024, 1, 12, 9)]),
+        ('FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,TH;COUNT=10', utc(2024, 1, 4, 9), utc(2024, 2, 20), utc(2024, 4, 1),
+         [utc(2024, 2, 27, 9), utc(2024, 2, 29, 9), utc(2024, 3, 12, 9)]),
+        ('FREQ=DAILY;BYDAY=SA,SU;COUNT=3', utc(2024, 1, 6, 9), utc(2024, 1, 1), utc(2024, 2, 1),
+         [utc(2024, 1, 6, 9), utc(2024, 1, 7, 9), utc(2024, 1, 13, 9)]),
+        ('FREQ=DAILY;INTERVAL=3;BYDAY=MO', utc(2024, 1, 1, 9), utc(2024, 1, 1), utc(2024, 2, 13),
+         [utc(2024, 1, 1, 9), utc(2024, 1, 22, 9), utc(2024, 2, 12, 9)]),
+        # Months without a 31st are skipped and do not count
+        ('FREQ=MONTHLY;COUNT=4', utc(2024, 1, 31, 9), utc(2024, 1, 1), utc(2025, 1, 1),
+         [utc(2024, 1, 31, 9), utc(2024, 3, 31, 9), utc(2024, 5, 31, 9), utc(2024, 7, 31, 9)]),
+        ('FREQ=MONTHLY', utc(2024, 1, 31, 9), utc(2024, 8, 1), utc(2024, 12, 31),
+         [utc(2024, 8, 31, 9), utc(2024, 10, 31, 9)]),
+        ('FREQ=YEARLY', utc(2024, 2, 29, 9), utc(2024, 1, 1), utc(2033, 1, 1),
+         [utc(2024, 2, 29, 9), utc(2028, 2, 29, 9), utc(2032, 2, 29, 9)]),
+        # Windows far past the series start
+        ('FREQ=MONTHLY;INTERVAL=3;COUNT=6', utc(2020, 1, 15, 9), utc(2020, 9, 1), utc(2030, 1, 1),
+         [utc(2020, 10, 15, 9), utc(2021, 1, 15, 9), utc(2021, 4, 15, 9)]),
+        ('FREQ=DAILY;INTERVAL=2', utc(2000, 1, 1, 9), utc(2024, 6, 1), utc(2024, 6, 6),
+         [utc(2024, 6, 1, 9), utc(2024, 6, 3, 9), utc(2024, 6, 5, 9)]),
+        ('FREQ=WEEKLY;COUNT=3', utc(2000, 1, 3, 9), utc(2024, 1, 1), utc(2025, 1, 1), []),
+        ('FREQ=DAILY;INTERVAL=3;BYDAY=MO,FR;COUNT=851', utc(2000, 1, 3, 9), utc(2024, 6, 1), utc(2024, 8, 1),
+         [utc(2024, 6, 7, 9), utc(2024, 6, 10, 9)]),
+        ('FREQ=MONTHLY;COUNT=149', utc(2000, 1, 31, 9), utc(2021, 1, 1), utc(2022, 1, 1),
+         [utc(2021, 1, 31, 9), utc(2021, 3, 31, 9)]),
+        # 1900 is not a leap year
+        ('FREQ=YEARLY;COUNT=8', utc(1896, 2, 29, 9), utc(1920, 1, 1), utc(1940, 1, 1),
+         [utc(1920, 2, 29, 9), utc(1924, 2, 29, 9), utc(1928, 2, 29, 9)]),
+    ]
+
+    def test_between(self):
+        for pattern, dtstart, start, end, expected in self.CASES:
+            with self.subTest(pattern=pattern, start=start):
+                rule = RecurrenceRule.from_pattern(pattern)
+                self.assertEqual(
+                    list(rule.between(dtstart, timedelta(hours=1), start, end)),
+                    [(occurrence, occurrence + timedelta(hours=1)) for occurrence in expected]
+                )
+
+    def test_expansion_seeks_to_the_window(self):
+        after = utc(2024, 6, 1)
+        for pattern, dtstart in (
+            ('FREQ=DAILY;INTERVAL=3;BYDAY=MO,FR', utc(2000, 1, 3, 9)),
+            ('FREQ=MONTHLY', utc(2000, 1, 31, 9)),
+        ):
+            with self.subTest(pattern=pattern):
+                index, first = next(RecurrenceRule.from_pattern(pattern)._iter_from(dtstart, after))
+                self.assertLess(after - first, timedelta(days=62))
+
+    def test_between_includes_occurrences_running_into_the_window(self):
+        rule = RecurrenceRule.from_pattern('FREQ=DAILY')
+        self.assertEqual(
+            list(rule.between(utc(2024, 1, 1, 23), timedelta(hours=2), utc(2024, 1, 3), utc(2024, 1, 4))),
+            [(utc(2024, 1, 2, 23), utc(2024, 1, 3, 1)), (utc(2024, 1, 3, 23), utc(2024, 1, 4, 1))]
+        )
+
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class OccurrenceTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        # Past the default one-year horizon
+        self.far = (timezone.now() + timedelta(days=400)).replace(hour=9, minute=0, second=0, microsecond=0)
+
+    def create(self, start, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/events/', {
+                'title': 'Event',
+                'start_time': start.isoformat(),
+                'end_time': (start + timedelta(hours=1)).isoformat(),
+                **fields
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return str(response.data['id'])
+
+    def test_single_event_past_the_horizon(self):
+        first, second = self.create(self.far), self.create(self.far)
+        self.assertEqual(EventOccurrence.objects.filter(event_id__in=[first, second]).count(), 2)
+        response = self.client.get('/api/events/range/', {
+            'start': (self.far - timedelta(days=1)).isoformat(),
+            'end': (self.far + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(sorted(str(row['id']) for row in response.data), sorted([first, second]))
+        self.assertEqual(EventConflict.objects.count(), 1)
+
+    def test_range_expands_recurring_series(self):
+        this_year = timezone.now().year
+        monthly = self.create(
+            datetime(this_year - 1, 1, 31, 9, tzinfo=dt_timezone.utc),
+            is_recurring=True, recurrence_pattern='FREQ=MONTHLY'
+        )
+        # Past the horizon, so expanded from the rule
+        response = self.client.get('/api/events/range/', {
+            'start': datetime(this_year + 3, 1, 1, tzinfo=dt_timezone.utc).isoformat(),
+            'end': datetime(this_year + 3, 6, 1, tzinfo=dt_timezone.utc).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(str(row['id']), row['start_time']) for row in response.data],
+            [(monthly, datetime(this_year + 3, month, 31, 9, tzinfo=dt_timezone.utc)) for month in (1, 3, 5)]
+        )
+
+    def test_materialize_command(self):
+        monday = self.far - timedelta(days=400 + self.far.weekday())
+        weekly = self.create(monday, is_recurring=True, recurrence_pattern='FREQ=WEEKLY')
+        single = self.create(self.far)
+        broken = Event.objects.create(
+            title='Broken', created_by=self.owner, start_time=self.far, end_time=self.far + timedelta(hours=1),
+            is_recurring=True, recurrence_pattern='not a rule'
+        )
+        sync_occurrences([broken])
+        # Rows from before the occurrence table
+        Event.objects.filter(pk=weekly).update(occurrences_until=None)
+        EventOccurrence.objects.filter(event_id=weekly).delete()
+
+        call_command('materialize_occurrences', days=28, stdout=StringIO())
+        weeks = EventOccurrence.objects.filter(event_id=weekly).count()
+        self.assertIn(weeks, (4, 5))
+        call_command('materialize_occurrences', days=56, stdout=StringIO())
+        self.assertEqual(EventOccurrence.objects.filter(event_id=weekly).count(), weeks + 4)
+        for event_id in (single, broken.pk):
+            self.assertEqual(EventOccurrence.objects.filter(event_id=event_id).count(), 1)
+
+    def test_conflicts_with_unmaterialized_events(self):
+        day = (timezone.now() + timedelta(days=7)).replace(hour=9, minute=0, second=0, microsecond=0)
+        single = self.create(day)
+        weekly = self.create(day + timedelta(hours=3), is_recurring=True, recurrence_pattern='FREQ=WEEKLY')
+        # Rows from before the occurrence table, and a series materialized for its first week only
+        Event.objects.filter(pk=single).update(occurrences_until=None)
+        Event.objects.filter(pk=weekly).update(occurrences_until=day + timedelta(days=1))
+        EventOccurrence.objects.filter(event_id=single).delete()
+        EventOccurrence.objects.filter(event_id=weekly, start_time__gte=day + timedelta(days=1)).delete()
+        EventConflict.objects.all().delete()
+
+        probe = self.create(day + timedelta(minutes=30))
+        later = self.create(day + timedelta(days=14, hours=3, minutes=30))
+        conflicts = EventConflict.objects.values_list('event', 'conflicting_event')
+        self.assertEqual(
+            {(str(event), str(other)) for event, other in conflicts},
+            {conflict_pair(single, probe), conflict_pair(weekly, later)}
+        )
+
+class CompileRuleTests(SimpleTestCase):
+    def test_compile_rule_caches_by_pattern(self):
+        rule = compile_rule({'FREQ': 'WEEKLY', 'BYDAY': ['MO', 'FR']})
+        self.assertIs(compile_rule({'BYDAY': ['MO', 'FR'], 'FREQ': 'WEEKLY'}), rule)
+        self.assertIsNot(compile_rule({'FREQ': 'WEEKLY', 'BYDAY': ['MO']}), rule)
+        self.assertIs(compile_rule('FREQ=WEEKLY;BYDAY=MO,FR'), compile_rule('FREQ=WEEKLY;BYDAY=MO,FR'))
+        self.assertEqual(compile_rule('FREQ=WEEKLY;BYDAY=FR,MO').to_pattern(), rule.to_pattern())
+
+    def test_rejects_bad_patterns(self):
+        for pattern in (
+            'FREQ=HOURLY', 'INTERVAL=2', 'FREQ=DAILY;INTERVAL=0', 'FREQ=DAILY;COUNT=-1',
+            'FREQ=WEEKLY;BYDAY=XX', 'FREQ=MONTHLY;BYDAY=MO', 'FREQ=DAILY;BYSETPOS=1',
+            'FREQ=DAILY;UNTIL=tomorrow', {'FREQ': 'DAILY', 'BYDAY': [['MO']]}, 42,
+        ):
+            with self.subTest(pattern=pattern), self.assertRaises(ValueError):
+                compile_rule(pattern)
+
+@override_settings(EVENTS={'TASKS_EAGER': True})
+class BatchCreateTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.viewer = User.objects.create_user('viewer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.day = (timezone.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def item(self, start_hour, **fields):
+        return {
+            'title': f'Event {start_hour}',
+            'start_time': (self.day + timedelta(hours=start_hour)).isoformat(),
+            'end_time': (self.day + timedelta(hours=start_hour + 1)).isoformat(),
+            **fields
+        }
+
+    def test_creates_the_batch(self):
+        with mock.patch('events.bulk.schedule_conflict_detection', wraps=schedule_conflict_detection) as detect:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/events/batch_create/', [
+                    self.item(9, permissions=[{'user_id': self.viewer.pk, 'role': 'EDITOR'}]),
+                    self.item(9.5),
+                    self.item(12),
+                ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(detect.call_count, 1)
+        ids = [str(item['id']) for item in response.data]
+        self.assertEqual(
+            sorted(EventPermission.objects.filter(event_id=ids[0]).values_list('user_id', 'role')),
+            [(self.owner.pk, EventPermission.Role.OWNER), (self.viewer.pk, EventPermission.Role.EDITOR)]
+        )
+        self.assertEqual(EventVersion.objects.filter(event_id__in=ids, version_number=1).count(), 3)
+        self.assertEqual(
+            EventChangeLog.objects.filter(event_id__in=ids, change_type=EventChangeLog.ChangeType.CREATE).count(),
+            3
+        )
+        conflicts = EventConflict.objects.values_list('event', 'conflicting_event')
+        self.assertEqual(
+            {(str(event), str(other)) for event, other in conflicts},
+            {conflict_pair(ids[0], ids[1])}
+        )
+
+    def test_unknown_user_fails_the_item(self):
+        response = self.client.post('/api/events/batch_create/', [
+            self.item(9),
+            self.item(10, permissions=[{'user_id': 0, 'role': 'VIEWER'}]),
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1], {'permissions': ['Unknown user_id 0']})
+        self.assertFalse(Event.objects.exists())
+
+@override_settings(EVENTS={'TASKS_EAGER': True, 'EXPORT_CHUNK_SIZE': 2})
+class EventExportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        start = datetime(2030, 1, 7, 9, tzinfo=dt_timezone.utc)
+        for title, pattern in (('Standup', 'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4'), ('Lunch', None), ('Review', None)):
+            response = self.client.post('/api/events/', {
+                'title': title,
+                'start_time': start.isoformat(),
+                'end_time': (start + timedelta(hours=1)).isoformat(),
+                'is_recurring': pattern is not None,
+                'recurrence_pattern': pattern,
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            start += timedelta(days=1)
+        self.client.patch(
+            f"/api/events/{Event.objects.get(title='Standup').pk}/",
+            {'title': 'Standup', 'version': 1}, format='json'
+        )
+
+    def export(self, export_format):
+        response = self.client.get('/api/events/export/', {'as': export_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Review', 'Lunch', 'Standup'])
+        self.assertEqual(list(rows[0]), ['id', 'title', 'description', 'location', 'start_time', 'end_time',
+                                         'is_recurring', 'recurrence_pattern', 'version', 'created_by_id',
+                                         'created_at', 'updated_at'])
+        self.assertEqual(rows[2]['recurrence_pattern'],
+                         {'FREQ': 'WEEKLY', 'INTERVAL': 1, 'BYDAY': ['MO', 'WE'], 'COUNT': 4})
+
+    def test_csv(self):
+        lines = self.export('csv').splitlines()
+        self.assertEqual(
+            lines[0],
+            'id,title,description,location,start_time,end_time,is_recurring,'
+            'recurrence_pattern,version,created_by_id,created_at,updated_at'
+        )
+        self.assertEqual(len(lines), 4)
+        self.assertIn(',FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE;COUNT=4,', lines[3].replace('"', ''))
+
+    def test_ics(self):
+        body = self.export('ics')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 3)
+        self.assertEqual(
+            [line for line in body.split('\r\n') if line.startswith('RRULE:')],
+            ['RRULE:FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE;COUNT=4']
+        )
+        self.assertEqual(
+            [line for line in body.split('\r\n') if line.startswith('SEQUENCE:')],
+            ['SEQUENCE:1', 'SEQUENCE:1', 'SEQUENCE:2']
+        )
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/events/export/', {'as': 'xml'})
+        self.assertEqual(response.status_code, 400)
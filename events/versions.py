@@ -0,0 +1,226 @@
+from collections import namedtuple
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+from .archive import archived_versions
+from .conf import events_setting
+from .models import EventVersion
+from .utils import generate_diff
+
+# Event fields recorded in version snapshots
+VERSIONED_FIELDS = (
+    'title', 'description', 'start_time', 'end_time', 'location',
+    'is_recurring', 'recurrence_pattern'
+)
+
+# A field's value on either side of a diff; MISSING when it is absent
+FieldChange = namedtuple('FieldChange', ('field', 'old', 'new'))
+MISSING = object()
+
+_datetime = serializers.DateTimeField()
+
+class StaleVersion(Exception):
+    """
+    An edit was made against a version the event has since moved past.
+    """
+
+def snapshot(event):
+    """
+    The flat, JSON-ready state of ``event`` that a version records.
+    """
+    return {
+        'title': event.title,
+        'description': event.description,
+        'start_time': _datetime.to_representation(event.start_time),
+        'end_time': _datetime.to_representation(event.end_time),
+        'location': event.location,
+        'is_recurring': event.is_recurring,
+        'recurrence_pattern': event.recurrence_pattern,
+    }
+
+def to_python(field, value):
+    """
+    Model value for a snapshot value.
+    """
+    if field in ('start_time', 'end_time') and value is not None:
+        return _datetime.to_internal_value(value)
+    return value
+
+def is_keyframe(version_number):
+    return (version_number - 1) % events_setting('VERSION_KEYFRAME_INTERVAL') == 0
+
+def build_version(event, previous, current, created_by, change_reason=''):
+    """
+    Unsaved EventVersion for ``event`` at ``event.version``, whose state
+    moved from the ``previous`` snapshot (None for the first version) to
+    ``current``. Every version stores its delta from the previous one;
+    keyframes also store the whole snapshot.
+    """
+    return EventVersion(
+        event=event,
+        version_number=event.version,
+        data=current if previous is None or is_keyframe(event.version) else None,
+        delta=None if previous is None else generate_diff(previous, current),
+        created_by=created_by,
+        change_reason=change_reason
+    )
+
+def apply_delta(state, delta):
+    """
+    Roll ``state`` forward by a generate_diff delta, in place.
+    """
+    state.update(delta['added'])
+    for key, change in delta['modified'].items():
+        state[key] = change['new']
+    for key in delta['removed']:
+        state.pop(key, None)
+    return state
+
+def chain(event_id, first, last):
+    """
+    Rows needed to rebuild versions ``first`` to ``last`` of an event:
+    everything from the last keyframe at or before ``first``, in order.
+    When ``first`` has been archived, that is every hot row up to ``last``;
+    archiving leaves the oldest hot row a keyframe.
+    """
+    keyframe = EventVersion.objects.filter(
+        event=OuterRef('event'), version_number__lte=first, data__isnull=False
+    ).order_by('-version_number').values('version_number')[:1]
+    return EventVersion.objects.filter(
+        event_id=event_id, version_number__gte=Coalesce(Subquery(keyframe), 0),
+        version_number__lte=last
+    ).order_by('version_number')
+
+def snapshots(event_id, first, last):
+    """
+    Map version number to snapshot for versions ``first`` to ``last`` of
+    an event, replaying deltas from the nearest keyframe in one query.
+    Versions older than the hot table are read from the archive.
+    """
+    result = {}
+    state = None
+    oldest = None
+    for number, data, delta in chain(event_id, first, last).values_list(
+        'version_number', 'data', 'delta'
+    ):
+        oldest = number if oldest is None else oldest
+        state = dict(data) if data is not None else apply_delta(state, delta)
+        if number >= first:
+            result[number] = dict(state)
+    if oldest is None or oldest > first:
+        for version in archived_versions(event_id):
+            if version.version_number < first:
+                break
+            if version.version_number <= last:
+                result[version.version_number] = version.snapshot
+    return result
+
+def reconstruct(event_id, version_number):
+    """
+    Snapshot of one version. Raises EventVersion.DoesNotExist.
+    """
+    try:
+        return snapshots(event_id, version_number, version_number)[version_number]
+    except KeyError:
+        raise EventVersion.DoesNotExist(f'Version {version_number} not found')
+
+def materialize(versions):
+    """
+    Set ``snapshot`` on EventVersion instances, with one query per event.
+    Archived versions arrive with theirs already set.
+    """
+    by_event = {}
+    for version in versions:
+        if not hasattr(version, 'snapshot'):
+            by_event.setdefault(version.event_id, []).append(version)
+    for event_id, group in by_event.items():
+        numbers = [version.version_number for version in group]
+        states = snapshots(event_id, min(numbers), max(numbers))
+        for version in group:
+            version.snapshot = states.get(version.version_number)
+    return versions
+
+def compose(deltas):
+    """
+    Fold consecutive deltas into one ``{field: FieldChange}``, keeping
+    each field's first old and last new value. Fields that end where
+    they started are dropped.
+    """
+    changes = {}
+
+    def record(field, old, new):
+        if field in changes:
+            changes[field] = changes[field]._replace(new=new)
+        else:
+            changes[field] = FieldChange(field, old, new)
+
+    for delta in deltas:
+        if not delta:
+            continue
+        for field, value in delta['added'].items():
+            record(field, MISSING, value)
+        for field, change in delta['modified'].items():
+            record(field, change['old'], change['new'])
+        for field, value in delta['removed'].items():
+            record(field, value, MISSING)
+    return {field: change for field, change in changes.items() if change.old != change.new}
+
+def deltas(event_id, first, last):
+    """
+    ``(version_number, delta)`` for versions ``first`` to ``last``, read
+    in one query, or from the archive for versions older than the hot
+    table. Raises EventVersion.DoesNotExist if any is missing.
+    """
+    rows = list(EventVersion.objects.filter(
+        event_id=event_id, version_number__gte=first, version_number__lte=last
+    ).order_by('version_number').values_list('version_number', 'delta'))
+    oldest = rows[0][0] if rows else last + 1
+    if first < oldest:
+        archived = []
+        for version in archived_versions(event_id):
+            if version.version_number < first:
+                break
+            if version.version_number < oldest:
+                archived.append((version.version_number, version.delta))
+        rows = archived[::-1] + rows
+    if first < 1 or len(rows) != last - first + 1:
+        raise EventVersion.DoesNotExist(f'Versions {first} to {last} not found')
+    return rows
+
+def diff_versions(event_id, from_version, to_version):
+    """
+    ``{field: FieldChange}`` taking version ``from_version`` to
+    ``to_version`` (in either direction), composed from the stored
+    deltas without rebuilding either snapshot.
+    """
+    low, high = sorted((from_version, to_version))
+    changes = compose(delta for _, delta in deltas(event_id, low, high)[1:])
+    if from_version > to_version:
+        changes = {
+            field: FieldChange(field, change.new, change.old) for field, change in changes.items()
+        }
+    return changes
+
+def as_diff(changes):
+    """
+    generate_diff's added/modified/removed form of ``{field: FieldChange}``.
+    """
+    diff = {'added': {}, 'modified': {}, 'removed': {}}
+    for field, change in changes.items():
+        if change.old is MISSING:
+            diff['added'][field] = change.new
+        elif change.new is MISSING:
+            diff['removed'][field] = change.old
+        else:
+            diff['modified'][field] = {'old': change.old, 'new': change.new}
+    return diff
+
+def typed_values(changes):
+    """
+    Model field values that apply ``{field: FieldChange}`` to an event.
+    """
+    return {
+        field: to_python(field, change.new)
+        for field, change in changes.items()
+        if field in VERSIONED_FIELDS and change.new is not MISSING
+    }
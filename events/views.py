@@ -1,29 +1,105 @@
+import json
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+from itertools import chain
+from operator import itemgetter
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404 as get_or_404
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery
 from django.utils import timezone
-from .models import Event, EventPermission, EventVersion, EventChangeLog, EventConflict
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from .models import (
+    Event, EventOccurrence, EventPermission, EventVersion, EventChangeLog, EventConflict
+)
 from .serializers import (
     EventSerializer, EventCreateSerializer, EventUpdateSerializer,
     EventPermissionSerializer, EventVersionSerializer, EventChangeLogSerializer,
-    EventConflictSerializer
+    EventConflictSerializer, FreeBusySerializer, SlotSearchSerializer, represent_events
+)
+from .pagination import (
+    ChangeLogCursorPagination, ConflictCursorPagination, EventCursorPagination, SyncPagination,
+    VersionCursorPagination
 )
+from .parsers import CSVParser, MessagePackParser, NDJSONParser
 from .permissions import IsEventOwnerOrEditor, IsEventOwner, HasEventPermission
-from .utils import detect_event_conflicts, generate_diff
+from .archive import archived_changelog, archived_changelog_values, archived_versions, attach_related
+from .audit import drain, record_change
+from .availability import (
+    busy_intervals, find_slots, free_intervals, merge_intervals, working_intervals
+)
+from .bulk import bulk_create_events, stream_import
+from .cache import (
+    collection_etag, etag_matches, event_etag, get_role_cache, if_match_version,
+    invalidate_roles, response_cache, touch_event_collections
+)
+from .conf import events_setting
+from .conflicts import clear_conflicts, refresh_conflicts, schedule_conflict_detection
+from .exports import CHANGELOG_FIELDS, CONTENT_TYPES, EVENT_FIELDS, export_lines
+from .feed import astream, get_broker, stream
+from .occurrences import SCHEDULE_FIELDS, clear_occurrences, schedule_changed, sync_occurrences
+from .recurrence import expand_occurrences
+from .renderers import EventStreamRenderer, MessagePackRenderer
+from .utils import generate_diff
+from .versions import (
+    StaleVersion, as_diff, build_version, deltas, diff_versions, materialize, snapshot,
+    typed_values
+)
+
+def parse_window(params):
+    """
+    Read an aware [start, end) window from ``params``.
+    Returns (start, end, error_message).
+    """
+    start = parse_datetime(str(params.get('start', '')))
+    end = parse_datetime(str(params.get('end', '')))
+    if start is None or end is None:
+        return None, None, 'start and end must be ISO 8601 datetimes'
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start, dt_timezone.utc)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end, dt_timezone.utc)
+    if start >= end:
+        return None, None, 'end must be after start'
+    return start, end, None
 
 class EventViewSet(viewsets.ModelViewSet):
     serializer_class = EventSerializer
     permission_classes = [permissions.IsAuthenticated, HasEventPermission]
+    pagination_class = EventCursorPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer]
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, MessagePackParser]
 
     def get_queryset(self):
-        user = self.request.user
-        return Event.objects.filter(
-            permissions__user=user,
-            is_deleted=False
-        ).distinct()
+        return self.with_related(Event.objects.visible_to(self.request.user))
+
+    def with_related(self, queryset):
+        latest_versions = EventVersion.objects.filter(
+            id=Subquery(
+                EventVersion.objects.filter(event=OuterRef('event'))
+                .order_by('-version_number')
+                .values('id')[:1]
+            )
+        ).select_related('created_by')
+
+        # Everything EventSerializer touches is loaded up front, so a page
+        # costs the same handful of queries whatever its size
+        return queryset.select_related('created_by').prefetch_related(
+            Prefetch('permissions', queryset=EventPermission.objects.select_related('user')),
+            Prefetch('versions', queryset=latest_versions, to_attr='latest_versions'),
+        )
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -32,53 +108,130 @@ class EventViewSet(viewsets.ModelViewSet):
             return EventUpdateSerializer
         return EventSerializer
 
+    def not_modified(self, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+
+    def stale_version(self, message):
+        # A failed If-Match is the client's precondition; without one the
+        # edit lost a race and can simply be retried
+        if 'If-Match' in self.request.headers:
+            return Response({'error': message}, status=status.HTTP_412_PRECONDITION_FAILED)
+        return Response({'error': message}, status=status.HTTP_409_CONFLICT)
+
+    def cached_response(self, key, etag, build):
+        """
+        Serve the payload cached under ``key``, building and caching it with
+        ``build()`` on a miss. Keys embed the ETag, so edits never need to
+        purge anything.
+        """
+        cache = response_cache()
+        data = cache.get(key)
+        if data is None:
+            data = build()
+            cache.set(key, data, events_setting('RESPONSE_CACHE_TTL'))
+        response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag = collection_etag(request)
+        if etag_matches(request, etag):
+            response = self.not_modified(etag)
+        else:
+            response = self.cached_response(f'events:list:{etag}', etag, self.list_page)
+        # The ETag depends on the negotiated renderer
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def list_page(self):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(represent_events(page)).data
+
+    def retrieve(self, request, *args, **kwargs):
+        # Resolve the ETag from three columns before loading anything else
+        event = get_or_404(
+            Event.objects.visible_to(request.user).only('id', 'version', 'updated_at'),
+            pk=kwargs['pk']
+        )
+        self.check_object_permissions(request, event)
+        etag = event_etag(event)
+        if etag_matches(request, etag):
+            return self.not_modified(etag)
+        return self.cached_response(
+            f'events:detail:{etag}', etag, lambda: represent_events([self.get_object()])[0]
+        )
+
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except StaleVersion as exc:
+            return self.stale_version(str(exc))
+
     def perform_create(self, serializer):
         with transaction.atomic():
             event = serializer.save(created_by=self.request.user)
-            
+            sync_occurrences([event])
+            touch_event_collections(event)
+
             # Create changelog entry
-            EventChangeLog.objects.create(
-                event=event,
-                version=event.versions.first(),
-                change_type=EventChangeLog.ChangeType.CREATE,
-                changed_by=self.request.user,
-                changes={'action': 'created'},
-                metadata={'initial_version': True}
+            record_change(
+                event, event.latest_versions[0], EventChangeLog.ChangeType.CREATE,
+                self.request.user, {'action': 'created'}, {'initial_version': True}
             )
 
-
-            detect_event_conflicts(event)
+            schedule_conflict_detection([event])
 
     def perform_update(self, serializer):
         with transaction.atomic():
-            old_data = self.get_serializer(self.get_object()).data
-            event = serializer.save()
+            previous = self.get_object()
+            old_data = self.get_serializer(previous).data
+            event = serializer.save(
+                expected_version=if_match_version(self.request, serializer.instance)
+            )
             new_data = self.get_serializer(event).data
+            if schedule_changed(previous, event):
+                sync_occurrences([event])
+                # Drop the overlaps the move ended and record the new ones
+                refresh_conflicts([event])
+            touch_event_collections(event)
 
             # Create changelog entry
-            EventChangeLog.objects.create(
-                event=event,
-                version=event.versions.latest('version_number'),
-                change_type=EventChangeLog.ChangeType.UPDATE,
-                changed_by=self.request.user,
-                changes=generate_diff(old_data, new_data)
+            record_change(
+                event, event.latest_versions[0], EventChangeLog.ChangeType.UPDATE,
+                self.request.user, generate_diff(old_data, new_data)
             )
 
-            # Detect conflicts
-            detect_event_conflicts(event)
+    def destroy(self, request, *args, **kwargs):
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except StaleVersion as exc:
+            return self.stale_version(str(exc))
 
     def perform_destroy(self, instance):
         with transaction.atomic():
+            expected = if_match_version(self.request, instance)
+            if expected != instance.version:
+                raise StaleVersion(f'Event is at version {instance.version}')
+            # Guarded by the version loaded, like an edit, so a delete never
+            # lands on top of a change it has not seen
+            now = timezone.now()
+            deleted = Event.objects.filter(pk=instance.pk, version=expected).update(
+                is_deleted=True, updated_at=now
+            )
+            if not deleted:
+                raise StaleVersion('Event was modified concurrently')
             instance.is_deleted = True
-            instance.save()
+            instance.updated_at = now
+            clear_occurrences(instance)
+            clear_conflicts(instance)
+            touch_event_collections(instance)
 
             # Create changelog entry
-            EventChangeLog.objects.create(
-                event=instance,
-                version=instance.versions.latest('version_number'),
-                change_type=EventChangeLog.ChangeType.DELETE,
-                changed_by=self.request.user,
-                changes={'action': 'deleted'}
+            record_change(
+                instance, instance.latest_versions[0], EventChangeLog.ChangeType.DELETE,
+                self.request.user, {'action': 'deleted'}
             )
 
     @action(detail=True, methods=['post'])
@@ -89,15 +242,18 @@ class EventViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             with transaction.atomic():
                 permissions = serializer.save(event=event)
+                invalidate_roles((permission.user_id, event.pk) for permission in permissions)
+                # New participants bring their own calendars into conflict
+                refresh_conflicts([event])
+                # The permission list is part of the representation, so move its ETag
+                event.save(update_fields=['updated_at'])
+                touch_event_collections(event)
                 
                 # Create changelog entry
-                EventChangeLog.objects.create(
-                    event=event,
-                    version=event.versions.latest('version_number'),
-                    change_type=EventChangeLog.ChangeType.SHARE,
-                    changed_by=request.user,
-                    changes={'permissions': serializer.data},
-                    metadata={'shared_with': [p.user_id for p in permissions]}
+                record_change(
+                    event, event.latest_versions[0], EventChangeLog.ChangeType.SHARE,
+                    request.user, {'permissions': serializer.data},
+                    {'shared_with': [p.user_id for p in permissions]}
                 )
                 
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -110,19 +266,160 @@ class EventViewSet(viewsets.ModelViewSet):
         serializer = EventPermissionSerializer(permissions, many=True)
         return Response(serializer.data)
 
+    def paginate_detail(self, queryset, pagination_class, serializer_class, prepare=None, archived=None):
+        paginator = pagination_class()
+        page = paginator.paginate_queryset(queryset, self.request, view=self, archived=archived)
+        if prepare is not None:
+            prepare(page)
+        serializer = serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
         event = self.get_object()
-        versions = event.versions.all()
-        serializer = EventVersionSerializer(versions, many=True)
-        return Response(serializer.data)
+        versions = event.versions.select_related('created_by')
+        return self.paginate_detail(
+            versions, VersionCursorPagination, EventVersionSerializer,
+            prepare=lambda page: materialize(attach_related(page)),
+            archived=archived_versions(event.pk)
+        )
 
     @action(detail=True, methods=['get'])
     def changelog(self, request, pk=None):
         event = self.get_object()
-        changelog = event.changelog.all()
-        serializer = EventChangeLogSerializer(changelog, many=True)
-        return Response(serializer.data)
+        # Entries still waiting in the outbox belong in the answer
+        drain(event_id=event.pk)
+        changelog = event.changelog.select_related('changed_by', 'version__created_by')
+        return self.paginate_detail(
+            changelog, ChangeLogCursorPagination, EventChangeLogSerializer,
+            prepare=lambda page: materialize([entry.version for entry in attach_related(page)]),
+            archived=archived_changelog(event.pk)
+        )
+
+    @action(detail=False, methods=['get'], url_path='conflicts')
+    def list_conflicts(self, request):
+        """
+        Live conflicts touching the events the user holds a permission on,
+        newest first, optionally narrowed to one ``event`` and one
+        ``status``. Pairs stop being listed once either event is moved
+        apart or deleted.
+        """
+        visible = Event.objects.visible_to(request.user).values('pk')
+        conflicts = EventConflict.objects.filter(
+            Q(event__in=visible) | Q(conflicting_event__in=visible)
+        )
+        resolution_status = request.query_params.get('status')
+        if resolution_status is not None:
+            if resolution_status not in EventConflict.ResolutionStatus.values:
+                return Response(
+                    {'error': f'status must be one of {", ".join(EventConflict.ResolutionStatus.values)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            conflicts = conflicts.filter(resolution_status=resolution_status)
+        event_id = request.query_params.get('event')
+        if event_id is not None:
+            try:
+                event_id = uuid.UUID(event_id)
+            except ValueError:
+                return Response({'error': 'event must be an event id'}, status=status.HTTP_400_BAD_REQUEST)
+            conflicts = conflicts.filter(Q(event_id=event_id) | Q(conflicting_event_id=event_id))
+        return self.paginate_detail(
+            conflicts.select_related('resolved_by'), ConflictCursorPagination, EventConflictSerializer
+        )
+
+    def stream_export(self, queryset, fields, filename, formats, archived=()):
+        """
+        Stream ``queryset`` as plain ``.values()`` rows read in chunks, so
+        memory stays flat however many rows there are, followed by any
+        ``archived`` rows.
+        """
+        export_format = self.request.query_params.get('as', 'ndjson')
+        if export_format not in formats:
+            return Response(
+                {'error': f"as must be one of: {', '.join(formats)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows = chain(
+            queryset.values(*fields).iterator(chunk_size=events_setting('EXPORT_CHUNK_SIZE')),
+            archived
+        )
+        response = StreamingHttpResponse(
+            export_lines(rows, export_format, fields),
+            content_type=CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        events = Event.objects.visible_to(request.user).order_by('-start_time', '-id')
+        return self.stream_export(events, EVENT_FIELDS, 'events', ('ndjson', 'csv', 'ics'))
+
+    @action(detail=True, methods=['get'], url_path='changelog/export')
+    def changelog_export(self, request, pk=None):
+        event = self.get_object()
+        drain(event_id=event.pk)
+        changelog = event.changelog.order_by('-changed_at', '-id')
+        return self.stream_export(
+            changelog, CHANGELOG_FIELDS, f'event-{event.pk}-changelog', ('ndjson', 'csv'),
+            archived=archived_changelog_values(event.pk)
+        )
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Events created, edited, shared or deleted since the ``since``
+        cursor, oldest change first: full representations for live events
+        and ids for deleted ones. Send back ``cursor`` next time, and call
+        again at once while ``has_more`` is true. Without ``since`` this is
+        a full sync of the live events.
+        """
+        paginator = SyncPagination()
+        settled = timezone.now() - timedelta(seconds=events_setting('SYNC_SETTLE_SECONDS'))
+        changed = Event.objects.shared_with(request.user).filter(updated_at__lte=settled)
+        if 'since' not in request.query_params:
+            changed = changed.filter(is_deleted=False)
+        page = paginator.paginate_queryset(
+            changed.only('id', 'updated_at', 'is_deleted'), request, view=self
+        )
+
+        live = [row.pk for row in page if not row.is_deleted]
+        events = {
+            event.pk: event for event in self.with_related(Event.objects.filter(pk__in=live))
+        }
+        return Response({
+            'events': EventSerializer([events[pk] for pk in live], many=True).data,
+            'deleted': [row.pk for row in page if row.is_deleted],
+            'cursor': paginator.encode_token(page[-1]) if page else request.query_params.get('since'),
+            'has_more': paginator.has_next,
+        })
+
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def feed(self, request):
+        """
+        Server-Sent Events stream of changelog entries on every event the
+        user holds a permission on. Clients resume after the entry id in
+        Last-Event-ID (or ``cursor``); without one the stream starts now.
+        """
+        cursor = request.headers.get('Last-Event-ID') or request.query_params.get('cursor')
+        if cursor is not None:
+            try:
+                cursor = int(cursor)
+            except ValueError:
+                return Response(
+                    {'error': 'cursor must be a changelog entry id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        subscription = get_broker().subscribe(request.user.pk)
+        # Under ASGI waiting for the next entry holds no thread
+        if isinstance(request._request, ASGIRequest):
+            frames = astream(request.user.pk, cursor, subscription)
+        else:
+            frames = stream(request.user.pk, cursor, subscription)
+        response = StreamingHttpResponse(frames, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
     @action(detail=True, methods=['get'])
     def diff(self, request, pk=None):
@@ -137,21 +434,52 @@ class EventViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            version1 = event.versions.get(version_number=version1_id)
-            version2 = event.versions.get(version_number=version2_id)
-        except EventVersion.DoesNotExist:
+            changes = diff_versions(event.pk, int(version1_id), int(version2_id))
+        except (EventVersion.DoesNotExist, ValueError):
             return Response(
                 {'error': 'One or both versions not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        diff = generate_diff(version1.data, version2.data)
-        return Response(diff)
+        return Response(as_diff(changes))
+
+    @action(detail=True, methods=['get'], url_path='diff/range')
+    def diff_range(self, request, pk=None):
+        """
+        The changes each version made, for versions ``from`` to ``to``.
+        """
+        event = self.get_object()
+        try:
+            first = int(request.query_params['from'])
+            last = int(request.query_params['to'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'from and to version numbers are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 <= last - first < events_setting('DIFF_RANGE_MAX_VERSIONS'):
+            return Response(
+                {'error': f"Range must cover 1 to {events_setting('DIFF_RANGE_MAX_VERSIONS')} versions"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            rows = deltas(event.pk, first, last)
+        except EventVersion.DoesNotExist:
+            return Response(
+                {'error': 'Version not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response([
+            {'version_number': number, 'changes': delta} for number, delta in rows
+        ])
 
     @action(detail=True, methods=['post'])
     def rollback(self, request, pk=None):
         event = self.get_object()
         version_id = request.data.get('version_id')
+        if if_match_version(request, event) != event.version:
+            return self.stale_version(f'Event is at version {event.version}')
 
         if not version_id:
             return Response(
@@ -160,48 +488,181 @@ class EventViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            version = event.versions.get(version_number=version_id)
-        except EventVersion.DoesNotExist:
+            changes = diff_versions(event.pk, event.version, int(version_id))
+        except (EventVersion.DoesNotExist, ValueError):
             return Response(
                 {'error': 'Version not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        values = typed_values(changes)
         with transaction.atomic():
-            # Create new version with rolled back data
-            new_version = EventVersion.objects.create(
-                event=event,
-                version_number=event.version + 1,
-                data=version.data,
-                created_by=request.user,
-                change_reason=f'Rolled back to version {version_id}'
-            )
-
-            # Update event with rolled back data
-            for key, value in version.data.items():
-                if key not in ['id', 'created_by', 'created_at', 'updated_at', 'version']:
-                    setattr(event, key, value)
+            # Write only the fields that differ, in a single UPDATE guarded
+            # by the version the changes were computed against
+            now = timezone.now()
+            updated = Event.objects.filter(pk=event.pk, version=event.version).update(
+                **values, version=F('version') + 1, updated_at=now
+            )
+            if not updated:
+                return self.stale_version('Event was modified concurrently, retry the rollback')
+
+            previous = snapshot(event)
+            for field, value in values.items():
+                setattr(event, field, value)
             event.version += 1
-            event.save()
+            event.updated_at = now
+
+            # Record the rollback as a new version
+            new_version = build_version(
+                event, previous, snapshot(event), request.user,
+                f'Rolled back to version {version_id}'
+            )
+            new_version.save()
+            if set(values) & set(SCHEDULE_FIELDS):
+                sync_occurrences([event])
+                refresh_conflicts([event])
+            touch_event_collections(event)
 
             # Create changelog entry
-            EventChangeLog.objects.create(
-                event=event,
-                version=new_version,
-                change_type=EventChangeLog.ChangeType.UPDATE,
-                changed_by=request.user,
-                changes={'action': 'rollback', 'to_version': version_id}
+            record_change(
+                event, new_version, EventChangeLog.ChangeType.UPDATE,
+                request.user, {'action': 'rollback', 'to_version': version_id}
             )
 
+        event.latest_versions = [new_version]
         return Response(EventSerializer(event).data)
 
+    @action(detail=False, methods=['get'], url_path='cache-stats',
+            permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response({'permissions': get_role_cache().stats()})
+
+    @action(detail=False, methods=['get'], url_path='range')
+    def in_range(self, request):
+        start, end, error = parse_window(request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        if end - start > timedelta(days=events_setting('RANGE_MAX_DAYS')):
+            return Response(
+                {'error': f"Window may span at most {events_setting('RANGE_MAX_DAYS')} days"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        visible = Event.objects.visible_to(request.user)
+        rows = list(
+            EventOccurrence.objects.filter(
+                event__in=visible, start_time__lt=end, end_time__gt=start
+            ).order_by().values_list(
+                'event_id', 'start_time', 'end_time',
+                'event__title', 'event__location', 'event__is_recurring'
+            )
+        )
+
+        # Series not materialized that far yet are expanded past their horizon
+        for event in visible.filter(
+            Q(occurrences_until__isnull=True) | Q(is_recurring=True, occurrences_until__lt=end),
+            start_time__lt=end
+        ).only(
+            'id', 'title', 'location', 'start_time', 'end_time',
+            'is_recurring', 'recurrence_pattern', 'occurrences_until'
+        ):
+            for occurrence in expand_occurrences(
+                [(event.id, event.start_time, event.end_time,
+                  event.is_recurring, event.recurrence_pattern)],
+                start, end
+            ):
+                if event.occurrences_until is None or occurrence.start >= event.occurrences_until:
+                    rows.append((
+                        event.id, occurrence.start, occurrence.end,
+                        event.title, event.location, event.is_recurring
+                    ))
+
+        rows.sort(key=itemgetter(1))
+        return Response([
+            {
+                'id': event_id,
+                'title': title,
+                'location': location,
+                'start_time': occurrence_start,
+                'end_time': occurrence_end,
+                'is_recurring': is_recurring,
+            }
+            for event_id, occurrence_start, occurrence_end, title, location, is_recurring in rows
+        ])
+
+    @action(detail=False, methods=['post'])
+    def freebusy(self, request):
+        """
+        Merged busy intervals of each of ``users`` in [start, end), and the
+        intervals when all of them are free. Only times are disclosed,
+        never what the events are.
+        """
+        serializer = FreeBusySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        user_ids = serializer.validated_data['users']
+        start = serializer.validated_data['start']
+        end = serializer.validated_data['end']
+
+        busy = busy_intervals(user_ids, start, end)
+        anyone_busy = merge_intervals(interval for intervals in busy.values() for interval in intervals)
+        return Response({
+            'start': start,
+            'end': end,
+            'busy': {
+                user_id: [{'start': interval[0], 'end': interval[1]} for interval in intervals]
+                for user_id, intervals in busy.items()
+            },
+            'free': [
+                {'start': interval[0], 'end': interval[1]}
+                for interval in free_intervals(anyone_busy, start, end)
+            ],
+        })
+
+    @action(detail=False, methods=['post'])
+    def slots(self, request):
+        """
+        The earliest ``count`` times in [start, end) when all of ``users``
+        are free for ``duration`` minutes within their working hours, so a
+        meeting booked there creates no conflicts.
+        """
+        serializer = SlotSearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        working = working_intervals(
+            data['start'], data['end'], data['work_start'], data['work_end'],
+            data['weekdays'], data['timezone']
+        )
+        slots = find_slots(data['users'], working, data['duration'], data['step'], data['count'])
+        return Response({
+            'slots': [{'start': slot, 'end': slot + data['duration']} for slot in slots],
+        })
+
     @action(detail=False, methods=['post'])
     def batch_create(self, request):
         serializer = EventCreateSerializer(data=request.data, many=True)
         if serializer.is_valid():
-            events = serializer.save(created_by=request.user)
+            try:
+                events = bulk_create_events(serializer.validated_data, request.user)
+            except ValidationError as exc:
+                return Response(exc.detail, status=status.HTTP_400_BAD_REQUEST)
             return Response(
                 EventSerializer(events, many=True).data,
                 status=status.HTTP_201_CREATED
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='import',
+            parser_classes=[NDJSONParser, CSVParser])
+    def import_events(self, request):
+        """
+        Stream an NDJSON or CSV body into events. The response streams one
+        NDJSON error report per rejected row, then a summary line.
+        """
+        reports = stream_import(request.data, request.user, events_setting('IMPORT_CHUNK_SIZE'))
+        return StreamingHttpResponse(
+            (json.dumps(report, cls=JSONEncoder) + '\n' for report in reports),
+            content_type='application/x-ndjson'
+        )